@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+Runs the bootstrap scripts against the simulated RP1 and reports the bytes
+and I2C transactions per second they manage. Transactions are i2c_rdwr
+ioctls on the real hardware.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [root, os.path.join(root, "bootstrap"), os.path.join(root, "reversing")]
+
+from rp1.bootstrap import Bootstrap
+from rp1.sim import SimRP1
+from rp1.regmap import BLOCKS
+from rp1.upload import Manifest
+import load_firmware
+import dump_bootrom
+import resets
+
+FW_SIZE = 0x6570    # size of rp1_fw_0x20000000.bin
+
+def bench(name, fn, setup=None, **sim_args):
+    sim = SimRP1(**sim_args)
+    rp1 = Bootstrap(sim, run_line=sim)
+    if setup is not None:
+        setup(rp1)
+    sim.transfers = sim.messages = sim.bytes_read = sim.bytes_written = 0
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(rp1)
+    elapsed = time.perf_counter() - start
+
+    nbytes = sim.bytes_read + sim.bytes_written
+    print(f"{name:28} {elapsed*1000:9.1f} ms {sim.transfers:7d} xfers {sim.messages:8d} msgs "
+          f"{nbytes/elapsed/1024:9.1f} KiB/s {sim.transfers/elapsed:9.0f} xfers/s "
+          f"{sim.messages/elapsed:9.0f} msgs/s")
+
+def bench_sim(count):
+    sim = SimRP1()
+    sim.resets = [0, 0, 0]
+    addrs = [b.addr + off for b in BLOCKS for off in range(0, 0x100, 4)]
+    addrs = (addrs * (count // len(addrs) + 1))[:count]
+    read32 = sim.read32
+
+    start = time.perf_counter()
+    for a in addrs:
+        read32(a)
+    elapsed = time.perf_counter() - start
+    print(f"{'sim read32':28} {elapsed*1000:9.1f} ms {count/elapsed:12.0f} regs/s")
+
+def bench_diff(fw, manifest, verify=4):
+    # load once, flip a byte and load again, only the second load is what a
+    # rebuild after a small edit costs
+    edited = bytearray(fw)
+    edited[len(fw) // 2] ^= 0xff
+
+    def setup(rp1):
+        manifest.invalidate()
+        load_firmware.load_firmware(rp1, fw, manifest=manifest)
+
+    def run(rp1):
+        load_firmware.load_firmware(rp1, edited, manifest=manifest, verify=verify)
+
+    return run, setup
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reg-offsets", type=int, default=16,
+                        help="number of register offsets for the resets.py register sweep")
+    parser.add_argument("--fw", help="firmware image to load, random bytes by default")
+    args = parser.parse_args()
+
+    if args.fw:
+        fw = open(args.fw, "rb").read()
+    else:
+        fw = random.Random(0).randbytes(FW_SIZE)
+
+    bench_sim(1000000)
+    bench("load_firmware", lambda rp1: load_firmware.load_firmware(rp1, fw))
+    bench("load_firmware cleared", lambda rp1: load_firmware.load_firmware(rp1, fw, blank=0))
+    with tempfile.TemporaryDirectory() as tmp:
+        bench("load_firmware diff", *bench_diff(fw, Manifest(os.path.join(tmp, "manifest.json"))))
+        bench("load_firmware diff readback", *bench_diff(fw, Manifest(os.path.join(tmp, "manifest.json")), "all"))
+    bench("load_firmware bootrom", load_firmware.dump_bootrom)
+    bench("dump_bootrom", dump_bootrom.dump_bootrom, setup=resets.clear_resets)
+    bench("dump_bootrom voted", dump_bootrom.dump_bootrom_voted, setup=resets.clear_resets,
+          rom_flip_rate=0.001)
+    bench("resets tag sweep", resets.tag_sweep, setup=resets.clear_resets)
+    bench("resets reg sweep", lambda rp1: resets.reg_sweep(rp1, reg_offsets=range(0, args.reg_offsets*4, 4)),
+          setup=resets.clear_resets)
+    bench("resets bisect sweep", resets.bisect_sweep, setup=resets.clear_resets)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+Compares the compressors in reversing/eeprom_compress.py with the C tool
+from rpi-eeprom-compress: time, size, whether the exact mode makes the same
+bytes and whether everything decompresses again.
+
+Without inputs it makes up 128K of something that compresses like code.
+Real inputs are better, e.g. the loader.elf extract_fw.py writes.
+"""
+
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [os.path.join(root, "reversing")]
+
+from eeprom_compress import Compressor, compress, compress_exact, decompress
+
+C_TOOL = os.path.join(root, "reversing", "rpi-eeprom-compress", "compress")
+
+def synthetic(size, seed=0):
+    # mostly pieces of the last 256 bytes again, some new bytes and runs
+    rnd = random.Random(seed)
+    out = bytearray()
+    while len(out) < size:
+        r = rnd.random()
+        if r < 0.5 and len(out) > 16:
+            start = len(out) - rnd.randrange(1, min(len(out), 256) + 1)
+            out += out[start:start + rnd.randrange(3, 40)]
+        elif r < 0.55:
+            out += bytes([rnd.choice((0, 0xff))]) * rnd.randrange(4, 300)
+        else:
+            out += bytes(rnd.randrange(256) for _ in range(rnd.randrange(1, 8)))
+    return bytes(out[:size])
+
+def stream(data, chunk=16 * 1024):
+    c = Compressor()
+    out = io.BytesIO()
+    for i in range(0, len(data), chunk):
+        out.write(c.compress(data[i:i + chunk]))
+    out.write(c.flush())
+    return out.getvalue()
+
+def run(name, fn, data, reference=None):
+    start = time.perf_counter()
+    out = fn(data)
+    elapsed = time.perf_counter() - start
+    ok = decompress(out) == data
+    same = "" if reference is None else (" same as C" if out == reference else " differs from C")
+    print(f"  {name:8} {elapsed*1000:9.1f} ms {len(data)/elapsed/1024:8.1f} KiB/s "
+          f"{len(out):8d} bytes ({len(out)/max(len(data), 1)*100:5.1f}%){same}{'' if ok else ' BROKEN'}")
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*")
+    parser.add_argument("--c-tool", default=C_TOOL, help="compress built from rpi-eeprom-compress (default: %(default)s)")
+    parser.add_argument("--size", type=int, default=128 * 1024, help="size of the made up input")
+    args = parser.parse_args()
+
+    inputs = [(p, open(p, "rb").read()) for p in args.inputs] or [("synthetic", synthetic(args.size))]
+    have_c = os.access(args.c_tool, os.X_OK)
+    if not have_c:
+        print(f"{args.c_tool} not found, run make in reversing/rpi-eeprom-compress to compare with it")
+
+    for name, data in inputs:
+        print(f"{name}: {len(data)} bytes")
+        reference = None
+        if have_c:
+            reference = run("C", lambda d: subprocess.run([args.c_tool], input=d, stdout=subprocess.PIPE,
+                                                          check=True).stdout, data)
+        run("exact", compress_exact, data, reference)
+        run("fast", compress, data)
+        run("stream", stream, data)
+
+if __name__ == "__main__":
+    main()
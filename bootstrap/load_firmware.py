@@ -1,76 +1,73 @@
 #!/usr/bin/env python3
 
-from smbus2 import SMBus, i2c_msg
-import struct
-
-bus = SMBus(10)
-
-def write_bytes(addr, data):
-        write = i2c_msg.write(0x43, struct.pack(">I", addr) + data)
-        bus.i2c_rdwr(write)
-
-def read_bytes(addr, length):
-        write = i2c_msg.write(0x43, struct.pack(">I", addr))
-        bus.i2c_rdwr(write)
-        read = i2c_msg.read(0x43, length)
-        bus.i2c_rdwr(read)
-        return bytes(list(read))
-
-
-#original firmware clears some reset, after that, we can read the chip ID!
-write_bytes(0x40017004, struct.pack("<I", 0x800000))
-chipid = read_bytes(0x40000000, 4)
-print("Chip ID:", hex(struct.unpack("<I", chipid)[0]))
-
-# just clear all resets, there might be even more somewhere
-write_bytes(0x40017000, struct.pack("<I", 0xffffffff))
-write_bytes(0x40017004, struct.pack("<I", 0xffffffff))
-
-# dump the bootrom
-rom = open("bootrom.bin", "wb")
-
-for i in range(0, 64*1024, 64):
-    chunk = read_bytes(0 + i, 64)
-    rom.write(chunk)
-
-rom.close()
-
-# # load some code that just spins endlessly
-# write_bytes(0x20000000, b"\xfe\xe7")
-# 
-# write_bytes(0x4015400c, struct.pack("<I", 0xb007c0de))
-# write_bytes(0x40154010, struct.pack("<I", 0xb007c0de ^ 0x20000001))
-# write_bytes(0x40154018, struct.pack("<I", 0x100030d0))
-# 
-# write_bytes(0x40010008, struct.pack("<I", 0x100))
-# write_bytes(0x40154000, struct.pack("<I", 0x80000000))
-
-
-# load blinky binary
-fw = open("../payload/blinky/blinky.bin", "rb").read()
-
-for i in range(0, len(fw), 64):
-    chunk = fw[i:i+64]
-    write_bytes(0x20000000 + i, chunk)   
-
-write_bytes(0x4015400c, struct.pack("<I", 0xb007c0de))
-write_bytes(0x40154010, struct.pack("<I", 0xb007c0de ^ 0x20000001))
-write_bytes(0x40154018, struct.pack("<I", 0x100030d0))
-
-write_bytes(0x40010008, struct.pack("<I", 0x100))
-write_bytes(0x40154000, struct.pack("<I", 0x80000000))
-
-
-# # load original fw
-# fw = open("../reversing/rp1_fw_0x20000000.bin", "rb").read()
-
-# for i in range(0, len(fw), 64):
-#     chunk = fw[i:i+64]
-#     write_bytes(0x20000000 + i, chunk)   
-
-# write_bytes(0x4015400c, struct.pack("<I", 0xb007c0de))
-# write_bytes(0x40154010, struct.pack("<I", 0xb007c0de ^ 0x20000141))
-# write_bytes(0x40154018, struct.pack("<I", 0x100030d0))
-
-# write_bytes(0x40010008, struct.pack("<I", 0x100))
-# write_bytes(0x40154000, struct.pack("<I", 0x80000000))
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1 import regmap
+from rp1.bootstrap import Bootstrap
+from rp1.upload import VERIFY_SAMPLES, Manifest, boot_regs, read_image, upload_diff, upload_pieces
+
+def dump_bootrom(rp1):
+    # just clear all resets, there might be even more somewhere
+    rp1.write_regs(regmap.release())
+    return rp1.read_block(0, 64*1024)
+
+def load_firmware(rp1, fw, entry=None, sp=None, blank=None, manifest=None, verify=VERIFY_SAMPLES):
+    # fw is a flat binary or an ELF, entry and sp come from it if not given
+    image = read_image(fw, entry, sp)
+
+    # the boot handoff goes out after the last chunk of the image
+    regs = boot_regs(image.entry, image.sp)
+    if manifest is None:
+        return upload_pieces(rp1, image.pieces, blank, regs)
+
+    # the manifest only knows the SRAM, anything else is always sent
+    diff = []
+    rest = []
+    for p in image.pieces:
+        (diff if manifest.covers(p[0], len(p[1])) else rest).append(p)
+    stats = upload_pieces(rp1, rest, blank, () if diff else regs)
+    for i, (addr, data) in enumerate(diff):
+        stats += upload_diff(rp1, addr, data, manifest, verify, regs if i == len(diff) - 1 else (), image.writable)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Loads an ELF, or a flat binary at 0x20000000, into the RP1 and boots it")
+    parser.add_argument("fw", nargs="?", default="../payload/blinky/blinky.elf")
+    parser.add_argument("--entry", type=lambda x: int(x, 0),
+                        help="entry point, including the thumb bit, taken from the image by default")
+    parser.add_argument("--sp", type=lambda x: int(x, 0), help="initial SP, taken from the image by default")
+    parser.add_argument("--cleared", type=lambda x: int(x, 0), choices=[0x00, 0xff],
+                        help="RAM is known to be filled with this byte, don't upload blocks of it")
+    parser.add_argument("--manifest", help="only upload blocks that changed since the last load with this manifest file")
+    parser.add_argument("--verify", type=lambda x: x if x == "all" else int(x), default=VERIFY_SAMPLES,
+                        help="number of unchanged blocks to read back to check the manifest is still valid, "
+                             "or all to read back every one (default: %(default)s)")
+    parser.add_argument("--no-bootrom", action="store_true", help="don't dump the boot ROM first")
+    args = parser.parse_args()
+
+    rp1 = Bootstrap()
+
+    #original firmware clears some reset, after that, we can read the chip ID!
+    rp1.write_regs(regmap.release(["SYSINFO"]))
+    print("Chip ID:", hex(rp1.read_reg(regmap.addr("SYSINFO.CHIP_ID"))))
+
+    # dump the bootrom
+    if not args.no_bootrom:
+        rom = open("bootrom.bin", "wb")
+        rom.write(dump_bootrom(rp1))
+        rom.close()
+
+    # load some code that just spins endlessly with
+    #   load_firmware(rp1, b"\xfe\xe7")
+    # the original fw is ../reversing/rp1_fw_0x20000000.bin with --entry 0x20000141
+
+    fw = open(args.fw, "rb").read()
+    manifest = Manifest(args.manifest) if args.manifest else None
+    stats = load_firmware(rp1, fw, args.entry, args.sp, args.cleared, manifest, args.verify)
+    print(stats)
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,27 @@
 #!/usr/bin/env python3
 
-from smbus2 import SMBus, i2c_msg
-import gpiod
-import struct
-import time
+import os
 import sys
 
-bus = SMBus(10)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1 import regmap
+from rp1.bootstrap import Bootstrap, GpiodRunLine
+from rp1.upload import boot_regs, read_image, upload_pieces
 
-chip = gpiod.Chip("gpiochip2")
-run = chip.find_line("RP1_RUN")
-run.request(consumer="RP1_Loader", type=gpiod.LINE_REQ_DIR_OUT, default_vals=[1])
+rp1 = Bootstrap(run_line=GpiodRunLine())
 
-def write_bytes(addr, data):
-        write = i2c_msg.write(0x43, struct.pack(">I", addr) + data)
-        bus.i2c_rdwr(write)
-
-def read_bytes(addr, length):
-        write = i2c_msg.write(0x43, struct.pack(">I", addr))
-        bus.i2c_rdwr(write)
-        read = i2c_msg.read(0x43, length)
-        bus.i2c_rdwr(read)
-        return bytes(list(read))
-
-def reset_rp1():
-    run.set_value(0)
-    time.sleep(0.1)
-    run.set_value(1)
-    time.sleep(0.1)
-
-reset_rp1()
+rp1.reset()
 
 #original firmware clears some reset, after that, we can read the chip ID!
-write_bytes(0x40017004, struct.pack("<I", 0x800000))
-chipid = read_bytes(0x40000000, 4)
-print("Chip ID:", hex(struct.unpack("<I", chipid)[0]))
+rp1.write_regs(regmap.release(["SYSINFO"]))
+print("Chip ID:", hex(rp1.read_reg(regmap.addr("SYSINFO.CHIP_ID"))))
 
 # just clear all resets, there might be even more somewhere
-#write_bytes(0x40017000, struct.pack("<I", 0xffffffff))
-#write_bytes(0x40017004, struct.pack("<I", 1<<19))
-
-# load binary
-fw = open(sys.argv[1], "rb").read()
-
-for i in range(0, len(fw), 64):
-    chunk = fw[i:i+64]
-    write_bytes(0x20000000 + i, chunk)
+#rp1.write_regs(regmap.release())
+#rp1.write_regs(regmap.release(["SYS_RIO0"]))
 
-write_bytes(0x4015400c, struct.pack("<I", 0xb007c0de))
-write_bytes(0x40154010, struct.pack("<I", 0xb007c0de ^ 0x20000001))
-write_bytes(0x40154018, struct.pack("<I", 0x100030d0))
+# load the ELF, or a flat binary at 0x20000000
+image = read_image(open(sys.argv[1], "rb").read())
+print("entry %08x, sp %08x" % (image.entry, image.sp))
 
-write_bytes(0x40010008, struct.pack("<I", 0x100))
-write_bytes(0x40154000, struct.pack("<I", 0x80000000))
+print(upload_pieces(rp1, image.pieces, regs=boot_regs(image.entry, image.sp)))
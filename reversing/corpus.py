@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+"""
+Indexes a pile of EEPROM images: every section, the decompressed bootloader
+ELF and the RP1 firmware in it end up in a content addressed blob store, so
+what doesn't change between releases is stored once, and index.json maps each
+release to the hashes of its parts.
+
+Running it again over the same images only looks at the ones that are new or
+changed since the last run.
+"""
+
+import argparse
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import extract
+from extract import BootloaderImage, PAD_MAGIC
+from extract_fw import find_loader, locate_firmware
+
+INDEX_VERSION = 1
+
+# __DATE__ " " __TIME__ as gcc puts it into the binary
+_BUILD_DATE_RE = re.compile(rb"[A-Z][a-z]{2} [ 0-3][0-9] [12][0-9]{3}(?:[ \x00]+[0-2][0-9]:[0-5][0-9]:[0-5][0-9])?")
+
+def blob_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def put_blob(blobs, data):
+    """
+    Stores data in the blob directory unless it is already there, returns
+    its hash.
+    """
+    h = blob_hash(data)
+    path = os.path.join(blobs, h[:2], h)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # other workers may be writing the same blob
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return h
+
+def firmware_version(fw):
+    """
+    The build date of the firmware if it carries one, otherwise None.
+    """
+    m = _BUILD_DATE_RE.search(fw)
+    if m is None:
+        return None
+    return re.sub(rb"[ \x00]+", b" ", m.group(0)).decode()
+
+class Corpus:
+    """
+    A corpus directory: blobs/xx/<sha256> and index.json.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.blobs = os.path.join(root, "blobs")
+        self._index_path = os.path.join(root, "index.json")
+        try:
+            with open(self._index_path) as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {"version": INDEX_VERSION, "releases": {}}
+        if self.index.get("version") != INDEX_VERSION:
+            raise ValueError("%s: unsupported index version %r" % (self._index_path, self.index.get("version")))
+
+    @property
+    def releases(self):
+        return self.index["releases"]
+
+    def blob_path(self, h):
+        return os.path.join(self.blobs, h[:2], h)
+
+    def read_blob(self, h):
+        with open(self.blob_path(h), "rb") as f:
+            return f.read()
+
+    def put(self, data):
+        return put_blob(self.blobs, data)
+
+    def firmware(self, release):
+        """
+        The firmware blob of an indexed release, or None.
+        """
+        fw = self.releases[release].get("firmware")
+        return None if fw is None else self.read_blob(fw["hash"])
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(tmp, self._index_path)
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def index_image(root, path):
+    """
+    Worker: extracts one image into the blob store of the corpus at root and
+    returns its index entry.
+    """
+    extract.DEBUG = False
+    blobs = os.path.join(root, "blobs")
+    entry = {"path": os.path.abspath(path), "stat": _stat_key(path)}
+    try:
+        size = os.path.getsize(path)
+        if size not in extract.VALID_IMAGE_SIZES:
+            raise ValueError("not an EEPROM image, %d bytes" % size)
+        image = BootloaderImage(path)
+        entry["hash"] = blob_hash(image.data)
+        sections = []
+        for s in image.sections:
+            if s.magic == PAD_MAGIC:
+                continue
+            sections.append({"name": s.filename, "offset": s.offset, "magic": "%08x" % s.magic,
+                             "hash": put_blob(blobs, image.section_data(s))})
+        entry["sections"] = sections
+
+        s, elf = find_loader(image)
+        if s is not None:
+            entry["loader"] = {"section": s.filename, "hash": put_blob(blobs, elf)}
+            fw = locate_firmware(elf)
+            if fw is not None:
+                data = bytes(memoryview(elf)[fw.offset:fw.offset + fw.size])
+                entry["firmware"] = {"hash": put_blob(blobs, data), "offset": fw.offset, "size": fw.size,
+                                     "size_from": fw.source, "entry": fw.entry, "sp": fw.sp,
+                                     "version": firmware_version(data)}
+    except (Exception, SystemExit) as err:
+        # exit_error() exits, which shouldn't take the pool down with it
+        entry["error"] = str(err) or type(err).__name__
+    return entry
+
+def find_images(paths, pattern):
+    """
+    Yields (release name, path) for the images given or found below the
+    given directories. Releases are named by their path relative to the
+    directory.
+    """
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, dirnames, filenames in os.walk(p):
+                dirnames.sort()
+                for fn in sorted(fnmatch.filter(filenames, pattern)):
+                    path = os.path.join(dirpath, fn)
+                    yield os.path.splitext(os.path.relpath(path, p))[0], path
+        else:
+            yield os.path.splitext(os.path.basename(p))[0], p
+
+def update(corpus, images, jobs=None, force=False):
+    """
+    Indexes the (release, path) pairs that aren't indexed yet or changed
+    since, images that failed before are only retried with force. Returns
+    the number of images processed.
+    """
+    todo = []
+    for release, path in images:
+        old = corpus.releases.get(release)
+        if not force and old is not None and old["path"] == os.path.abspath(path) and old["stat"] == _stat_key(path):
+            continue
+        todo.append((release, path))
+    if not todo:
+        return 0
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        futures = {pool.submit(index_image, corpus.root, path): release for release, path in todo}
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            release = futures[future]
+            entry = future.result()
+            corpus.releases[release] = entry
+            if "error" in entry:
+                sys.stderr.write("%s: %s\n" % (release, entry["error"]))
+            else:
+                fw = entry.get("firmware")
+                print("[%d/%d] %s: %d sections, firmware %s" % (i + 1, len(todo), release, len(entry["sections"]),
+                      "%s %s" % (fw["hash"][:12], fw["version"] or "") if fw else "not found"))
+            # saved as we go, an interrupted run keeps what it has done
+            corpus.save()
+    return len(todo)
+
+def print_index(corpus):
+    for release, entry in sorted(corpus.releases.items()):
+        if "error" in entry:
+            print("%-50s error: %s" % (release, entry["error"]))
+            continue
+        fw = entry.get("firmware")
+        if fw is None:
+            print("%-50s no firmware" % release)
+        else:
+            print("%-50s %s %#07x entry %#x sp %#x %s" % (release, fw["hash"][:12], fw["size"],
+                                                         fw["entry"], fw["sp"], fw["version"] or ""))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default="corpus", help="corpus directory (default: corpus)")
+    sub = parser.add_subparsers(dest="cmd")
+
+    p = sub.add_parser("index", help="index images or directories of them")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("--pattern", default="pieeprom-*.bin", help="images to pick up in directories")
+    p.add_argument("-j", "--jobs", type=int, help="worker processes (default: one per CPU)")
+    p.add_argument("--force", action="store_true", help="reindex everything")
+
+    sub.add_parser("list", help="list the indexed releases and their firmware")
+
+    args = parser.parse_args()
+
+    extract.DEBUG = False
+    corpus = Corpus(args.corpus)
+    if args.cmd == "index":
+        n = update(corpus, find_images(args.paths, args.pattern), args.jobs, args.force)
+        print("%d images indexed, %d releases in %s" % (n, len(corpus.releases), args.corpus))
+    elif args.cmd == "list":
+        print_index(corpus)
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
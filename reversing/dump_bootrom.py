@@ -1,74 +1,152 @@
 #!/usr/bin/env python3
 
-from smbus2 import SMBus, i2c_msg
-import gpiod
-import struct
-import time
-
-bus = SMBus(10)
-
-chip = gpiod.Chip("gpiochip2")
-run = chip.find_line("RP1_RUN")
-run.request(consumer="RP1_Loader", type=gpiod.LINE_REQ_DIR_OUT, default_vals=[1])
-
-def write_bytes(addr, data):
-        write = i2c_msg.write(0x43, struct.pack(">I", addr) + data)
-        bus.i2c_rdwr(write)
-
-def read_bytes(addr, length):
-        write = i2c_msg.write(0x43, struct.pack(">I", addr))
-        bus.i2c_rdwr(write)
-        read = i2c_msg.read(0x43, length)
-        bus.i2c_rdwr(read)
-        return bytes(list(read))
-
-def reset_rp1():
-    run.set_value(0)
-    time.sleep(0.1)
-    run.set_value(1)
-    time.sleep(0.1)
-
-def read_reg(addr):
-    reg = read_bytes(addr, 4)
-    return struct.unpack("<I", reg)[0]
-
-def write_reg(addr, val):
-    write_bytes(addr, struct.pack("<I", val))
-
-def reg_print(addr):
-    print(hex(read_reg(addr)))
-
-def dump_reg_area(addr, l):
-    regs = b""
-    for i in range(0, l, 4):
-        regs += read_bytes(addr + i, 4)
-    print(hexdump(regs))
+import argparse
+import atexit
+import os
+import sys
 
-def main():
-    reset_rp1()
-
-    #original firmware clears some reset, after that, we can read the chip ID!
-    write_bytes(0x40017004, struct.pack("<I", 0x800000))
-    chipid = read_bytes(0x40000000, 4)
-    print("Chip ID:", hex(struct.unpack("<I", chipid)[0]))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1 import regmap
+from rp1.bootstrap import MAX_XFER_LEN, Bootstrap, GpiodRunLine
+from rp1.hexdump import hexdump, registers
+from rp1.trace import attach
 
-    # clear all the resets
-    write_reg(0x40000000 + 0x017000 + 0, 0xffffffff)
-    write_reg(0x40000000 + 0x017000 + 4, 0xffffffff)
-    write_reg(0x40000000 + 0x017000 + 8, 0xffffffff)
+def reg_print(rp1, addr):
+    print(hex(rp1.read_reg(addr)))
 
-    # dump the bootrom
-    rom = open("bootrom.bin", "wb")
+def dump_reg_area(rp1, addr, l):
+    print(hexdump(rp1.read_block(addr, l, chunk=4), addr, registers))
 
+def dump_bootrom(rp1):
     # dump 32K bootrom
     # the window is 64K, but after 32K the ROM repeats
     # we dump the upper 32K, because the first 8 bytes are always 0? might be some controls there
     # also we dump 4 bytes at a time. dumping 64 byte chunks yields randomly flipped bits
-    for i in range(0, 32*1024, 4):
-        chunk = read_bytes(0x8000 + i, 4)
-        rom.write(chunk)
+    return rp1.read_block(0x8000, 32*1024, chunk=4)
+
+def _read_blocks(rp1, reads, retries):
+    """
+    Reads a list of (addr, length), retrying a batch that fails. Reading the
+    ROM has no side effects, so retrying is always safe.
+    """
+    for attempt in range(retries + 1):
+        b = rp1.batch()
+        for addr, length in reads:
+            b.read(addr, length)
+        try:
+            return b.run()
+        except OSError:
+            if attempt == retries:
+                raise
+
+def _vote(values, nbits):
+    """
+    Per bit majority of a list of equally sized ints. The votes for every bit
+    are counted in bit planes, so this works on whole blocks at once.
+
+    Returns the bits set in more than half of the values and the mask of the
+    bits without a majority, a tie between exactly half of them.
+    """
+    mask = (1 << nbits) - 1
+    planes = []
+    for carry in values:
+        for i in range(len(planes)):
+            planes[i], carry = planes[i] ^ carry, planes[i] & carry
+        if carry:
+            planes.append(carry)
+
+    def at_least(threshold):
+        # count >= threshold, i.e. count - threshold doesn't borrow
+        if threshold >> len(planes):
+            return 0
+        borrow = 0
+        for i, p in enumerate(planes):
+            t = mask if (threshold >> i) & 1 else 0
+            borrow = (~p & t) | (~p & borrow) | (t & borrow)
+        return ~borrow & mask
+
+    n = len(values)
+    majority = at_least(n // 2 + 1)
+    tied = at_least(n // 2) & ~majority if n % 2 == 0 else 0
+    return majority, tied
+
+def dump_bootrom_voted(rp1, votes=3, block=64, retries=3):
+    """
+    Reads the ROM in blocks, every block votes times, and decides every bit
+    by majority. Words with bits that have none, a tie with an even number
+    of votes, are read again 4 bytes at a time, which doesn't seem to flip
+    bits. block has to be a multiple of 4 of at most 64 bytes that divides
+    32K.
+
+    Returns the ROM, a confidence map with one byte per ROM byte: the number
+    of block reads that agreed with the final value, and the addresses of
+    the words that had to be read again.
+    """
+    size = 32*1024
+    if block > MAX_XFER_LEN or block % 4 or size % block:
+        raise ValueError("block size %d doesn't divide the ROM into reads of up to %d bytes" % (block, MAX_XFER_LEN))
+    addrs = [0x8000 + off for off in range(0, size, block)]
+    reads = _read_blocks(rp1, [(addr, block) for addr in addrs for _ in range(votes)], retries)
+
+    rom = bytearray(size)
+    conf = bytearray([votes]) * size
+    voted = []
+    disputed = []
+    for i, addr in enumerate(addrs):
+        copies = reads[i*votes:(i+1)*votes]
+        off = addr - 0x8000
+        if copies.count(copies[0]) == votes:
+            rom[off:off + block] = copies[0]
+            continue
+        majority, tied = _vote([int.from_bytes(c, "little") for c in copies], block * 8)
+        rom[off:off + block] = majority.to_bytes(block, "little")
+        voted.append(i)
+        tied = tied.to_bytes(block, "little")
+        disputed += [addr + w for w in range(0, block, 4) if any(tied[w:w + 4])]
+
+    # the words without a majority are read again the slow way
+    slow = _read_blocks(rp1, [(addr, 4) for addr in disputed], retries)
+    for addr, word in zip(disputed, slow):
+        rom[addr - 0x8000:addr - 0x8000 + 4] = word
+
+    for i in voted:
+        off = i * block
+        copies = reads[i*votes:(i+1)*votes]
+        for j in range(block):
+            conf[off + j] = sum(c[j] == rom[off + j] for c in copies)
+
+    return bytes(rom), bytes(conf), disputed
+
+def main():
+    parser = argparse.ArgumentParser(description="Dumps the 32K boot ROM to bootrom.bin")
+    parser.add_argument("--votes", type=int, default=3, help="number of reads of every block")
+    parser.add_argument("--block", type=int, default=64, help="bytes per read")
+    parser.add_argument("--slow", action="store_true", help="only do 4 byte reads, no voting")
+    parser.add_argument("--trace", help="record every bus transaction to this file, see i2ctrace.py")
+    args = parser.parse_args()
+    if args.block > MAX_XFER_LEN or args.block % 4 or 32*1024 % args.block:
+        parser.error("--block has to be a multiple of 4 of at most %d that divides 32K" % MAX_XFER_LEN)
+
+    rp1 = Bootstrap(run_line=GpiodRunLine())
+    if args.trace:
+        atexit.register(attach(rp1, open(args.trace, "wb")).close)
+    rp1.reset()
+
+    #original firmware clears some reset, after that, we can read the chip ID!
+    rp1.write_regs(regmap.release(["SYSINFO"]))
+    print("Chip ID:", hex(rp1.read_reg(regmap.addr("SYSINFO.CHIP_ID"))))
 
-    rom.close()
+    # clear all the resets
+    rp1.write_regs(regmap.release())
+
+    # dump the bootrom
+    if args.slow:
+        rom = dump_bootrom(rp1)
+    else:
+        rom, conf, disputed = dump_bootrom_voted(rp1, args.votes, args.block)
+        print(f"{len(disputed)} words without a majority needed 4 byte reads:", " ".join(hex(a) for a in disputed))
+        open("bootrom.conf", "wb").write(conf)
+    open("bootrom.bin", "wb").write(rom)
 
 if __name__ == "__main__":
     main()
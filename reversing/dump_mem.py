@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Dumps RP1 memory into a file, once or periodically into a ring of files.
+
+What to dump is "sram", "periph" (all of BAR1, PCIe only), a block name from
+rp1/regmap.py or an address, with --length. The output file is mapped and
+filled in place, so dumping a whole BAR doesn't need the memory for it.
+
+    ./dump_mem.py sram -o sram.bin --pcie
+    ./dump_mem.py sram -o sram --pcie --every 0.001 --ring 64
+
+The second one keeps the last 64 captures of the SRAM in sram.000.bin ..
+sram.063.bin, sram.index says which is which. Stop it with ^C.
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1 import regmap
+from rp1.capture import CHUNK, capture, capture_ring, read_index
+from rp1.pcie import RP1_BAR1_LEN, RP1_BAR2_LEN
+
+def region(what, length, pcie):
+    if what == "sram":
+        return regmap.SRAM_BASE, length or (RP1_BAR2_LEN if pcie else regmap.SRAM_SIZE)
+    if what == "periph":
+        return regmap.PERIPH_BASE, length or RP1_BAR1_LEN
+    try:
+        b = regmap.block(what)
+        return b.addr, length or b.size
+    except KeyError:
+        pass
+    if length is None:
+        sys.exit("--length is needed with an address")
+    return int(what, 0), length
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("what", nargs="?", default="sram", help="sram, periph, a block or an address")
+    parser.add_argument("-o", "--output", required=True, help="output file, the prefix with --ring")
+    parser.add_argument("--length", type=lambda x: int(x, 0))
+    parser.add_argument("--pcie", action="store_true", help="read the BARs instead of using the bootstrap interface")
+    parser.add_argument("--every", type=float, help="capture periodically, every that many seconds")
+    parser.add_argument("--ring", type=int, default=16, help="number of files to keep with --every (default: %(default)d)")
+    parser.add_argument("--count", type=int, help="stop after that many captures")
+    parser.add_argument("--chunk", type=lambda x: int(x, 0), default=CHUNK, help="bytes per read (default: %(default)#x)")
+    args = parser.parse_args()
+
+    addr, length = region(args.what, args.length, args.pcie)
+
+    if args.pcie:
+        from rp1.pcie import RP1Bars
+        dev = RP1Bars()
+    else:
+        from rp1.bootstrap import Bootstrap
+        dev = Bootstrap()
+
+    if args.every is None:
+        capture(dev, addr, length, args.output, args.chunk)
+        print("%08x+%x -> %s" % (addr, length, args.output))
+        return
+
+    n, late = capture_ring(dev, addr, length, args.output, args.ring, args.every, args.count, args.chunk)
+    print("%d captures of %08x+%x, %d late" % (n, addr, length, late))
+    for i, t, path in read_index(args.output):
+        print("  %6d %s %s" % (i, datetime.datetime.fromtimestamp(t).isoformat(" "), path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+
+"""
+The compression used for the bootloader sections in the EEPROM images, as
+implemented by rpi-eeprom-compress.
+
+The stream is a sequence of groups: a flag byte followed by eight tokens, the
+lowest flag bit first. A clear bit is a literal byte. A set bit is a back
+reference of two bytes, the distance - 1 into the last 256 output bytes and
+the length - 1.
+
+The stream ends at EOF where a literal would be expected, EOF in the middle of
+a back reference is an error.
+
+compress.c finds the cheapest encoding, 9 bits per literal and 17 per back
+reference, with a trie of everything in the window. compress_exact() is a
+port of it that makes the same output. compress() and Compressor get to
+the same size, usually, finding matches through hash chains instead, and
+work on a stream.
+"""
+
+import argparse
+import re
+import sys
+
+HISTORY = 256
+
+def _plan(cmd):
+    # runs of tokens for a flag byte: n > 0 is n literals, -1 a back reference
+    runs = []
+    for i in range(8):
+        if cmd & (1 << i):
+            runs.append(-1)
+        elif runs and runs[-1] > 0:
+            runs[-1] += 1
+        else:
+            runs.append(1)
+    return tuple(runs)
+
+_PLANS = [_plan(cmd) for cmd in range(256)]
+
+# bytes in a group including the flag byte
+_GROUP_LEN = [9 + bin(cmd).count("1") for cmd in range(256)]
+
+def _decode(src, out, pos):
+    """
+    Decodes src into the bytearray out starting at pos, out[pos - 256:pos]
+    being the history. out is grown when it is too small. Returns the new
+    position.
+    """
+    n = len(src)
+    i = 0
+    size = len(out)
+    while i < n:
+        cmd = src[i]
+        i += 1
+        for run in _PLANS[cmd]:
+            if run > 0:
+                if i + run > n:
+                    # EOF where a literal is expected ends the stream
+                    run = n - i
+                    if pos + run > size:
+                        out.extend(bytes(run))
+                    out[pos:pos + run] = src[i:n]
+                    return pos + run
+                if pos + run > size:
+                    out.extend(bytes(max(size, run)))
+                    size = len(out)
+                out[pos:pos + run] = src[i:i + run]
+                pos += run
+                i += run
+            else:
+                if i + 2 > n:
+                    raise ValueError("Unexpected EOF")
+                dist = src[i] + 1
+                length = src[i + 1] + 1
+                i += 2
+                if pos + length > size:
+                    out.extend(bytes(max(size, length)))
+                    size = len(out)
+                start = pos - dist
+                if dist >= length:
+                    out[pos:pos + length] = out[start:start + length]
+                else:
+                    # overlapping copy, repeats the last dist bytes
+                    out[pos:pos + length] = (out[start:pos] * (length // dist + 1))[:length]
+                pos += length
+    return pos
+
+def decompress(src, size=None):
+    """
+    Decompresses a whole stream into a preallocated buffer. size is the
+    expected output size if known, otherwise the buffer is estimated and
+    grown as needed. Returns a bytearray.
+    """
+    out = bytearray(HISTORY + (size if size is not None else len(src) * 3))
+    pos = _decode(memoryview(src).cast("B"), out, HISTORY)
+    del out[pos:]
+    del out[:HISTORY]
+    return out
+
+class Decompressor:
+    """
+    Streaming decoder, feed it chunks with decompress() and call flush() at
+    the end of the stream.
+    """
+    def __init__(self):
+        self._history = bytearray(HISTORY)
+        self._pending = b""
+
+    def decompress(self, data):
+        src = self._pending + bytes(data)
+        # only whole groups, whether a short group is the end of the stream
+        # is only known in flush()
+        p = 0
+        n = len(src)
+        while p < n and p + _GROUP_LEN[src[p]] <= n:
+            p += _GROUP_LEN[src[p]]
+        self._pending = src[p:]
+        return self._run(src[:p])
+
+    def flush(self):
+        out = self._run(self._pending)
+        self._pending = b""
+        return out
+
+    def _run(self, src):
+        out = self._history + bytes(len(src) * 3)
+        pos = _decode(src, out, HISTORY)
+        self._history = out[pos - HISTORY:pos]
+        return bytes(out[HISTORY:pos])
+
+def decompress_file(fin, fout, chunk=1024*1024):
+    d = Decompressor()
+    while True:
+        data = fin.read(chunk)
+        if not data:
+            break
+        fout.write(d.decompress(data))
+    fout.write(d.flush())
+
+# longest back reference, and how far back it can reach
+MAX_MATCH = 256
+
+LITERAL_COST = 9
+MATCH_COST = 17
+
+class _Encoder:
+    """
+    Packs tokens into groups. Only whole groups are handed out by take(),
+    the open one stays until it has its eight tokens or finish().
+    """
+    def __init__(self):
+        self.out = bytearray(1)
+        self._flag = 0
+        self._bit = 0
+
+    def _next(self):
+        self._bit += 1
+        if self._bit == 8:
+            self._flag = len(self.out)
+            self.out.append(0)
+            self._bit = 0
+
+    def literal(self, byte):
+        self.out.append(byte)
+        self._next()
+
+    def ref(self, dist, length):
+        self.out[self._flag] |= 1 << self._bit
+        self.out.append(dist - 1)
+        self.out.append(length - 1)
+        self._next()
+
+    def take(self):
+        out = bytes(self.out[:self._flag])
+        del self.out[:self._flag]
+        self._flag = 0
+        return out
+
+    def finish(self):
+        if self._bit == 0:
+            # the open group has no tokens yet
+            del self.out[self._flag:]
+        out = bytes(self.out)
+        self.out = bytearray(1)
+        self._flag = self._bit = 0
+        return out
+
+def _common_suffix(data, a, b, limit):
+    """
+    Number of equal bytes before positions a and b, at most limit.
+    """
+    k = 0
+    step = 4
+    while k + step <= limit and data[a - k - step:a - k] == data[b - k - step:b - k]:
+        k += step
+        if step < 64:
+            step <<= 1
+    while step > 1:
+        step >>= 1
+        if k + step <= limit and data[a - k - step:a - k] == data[b - k - step:b - k]:
+            k += step
+    return k
+
+def _common_prefix(data, a, b, limit):
+    # most matches are short, start small and gallop
+    k = 0
+    step = 4
+    while k + step <= limit and data[a + k:a + k + step] == data[b + k:b + k + step]:
+        k += step
+        if step < 64:
+            step <<= 1
+    while step > 1:
+        step >>= 1
+        if k + step <= limit and data[a + k:a + k + step] == data[b + k:b + k + step]:
+            k += step
+    return k
+
+def _optimal_exact(data):
+    """
+    The parse compress.c makes, with its trie of the reversed prefixes in
+    the window and the same tie breaking. Returns the lists cost, length - 1
+    and distance - 1 of the cheapest encoding of every prefix of data.
+    """
+    n = len(data)
+    cost = [0] * (n + 1)
+    mlens = bytearray(n + 1)
+    moffs = bytearray(n + 1)
+    # a node is [off, len, children]
+    root = {}
+    for k in range(1, n + 1):
+        min_cost = cost[k - 1] + LITERAL_COST
+        min_mlen = min_moff = 0
+        at = k
+        bound = k - MAX_MATCH if k > MAX_MATCH else 0
+        p = root
+        while at > bound:
+            left = at - bound
+            c = data[at - 1]
+            node = p.get(c)
+            if node is None:
+                node = [0, 0, {}]
+                p[c] = node
+                mlen = left
+            else:
+                off = node[0]
+                moff = at - off
+                if moff > MAX_MATCH:
+                    node[2] = {}
+                    mlen = left
+                else:
+                    if node[1] < left:
+                        left = node[1]
+                    mlen = _common_suffix(data, at, off, left)
+                    if not mlen:
+                        raise AssertionError("compress.c would have hit assert(mlen > 0) at %d" % k)
+
+                    # the first of the cheapest bases wins, like the strict < in compress.c
+                    seg = cost[at - mlen:at]
+                    m = min(seg)
+                    if m + MATCH_COST < min_cost:
+                        base = at - mlen + seg.index(m)
+                        min_cost = m + MATCH_COST
+                        min_mlen = k - base - 1
+                        min_moff = moff - 1
+
+                    if mlen != node[1]:
+                        # split, keyed by the byte the compare stopped at
+                        key = data[off - mlen - 1] if mlen < left else data[off - mlen]
+                        node[1] -= mlen
+                        node[0] -= mlen
+                        node = [0, 0, {key: node}]
+                        p[c] = node
+            node[0] = at
+            node[1] = mlen
+            p = node[2]
+            at -= mlen
+        cost[k] = min_cost
+        mlens[k] = min_mlen
+        moffs[k] = min_moff
+    return cost, mlens, moffs
+
+def compress_exact(data):
+    """
+    Compresses like compress.c, byte for byte. Needs all of the input and is
+    slower than compress().
+    """
+    data = bytes(data)
+    cost, mlens, moffs = _optimal_exact(data)
+    tokens = []
+    n = len(data)
+    while n:
+        if mlens[n] == 0:
+            n -= 1
+            tokens.append((n, 0, 0))
+        else:
+            length = mlens[n] + 1
+            n -= length
+            tokens.append((n, moffs[n + length] + 1, length))
+    enc = _Encoder()
+    for pos, dist, length in reversed(tokens):
+        if dist:
+            enc.ref(dist, length)
+        else:
+            enc.literal(data[pos])
+    return enc.finish()
+
+_RUN_RE = re.compile(rb"(.)\1+", re.S)
+
+def _keys(data, lo):
+    """
+    Hash chain keys of every position from lo on: the byte pair, or inside
+    a run of one byte, the byte and how much of the run is left, so the
+    candidates for a run are the ones that end the same way.
+    """
+    keys = [data[i] | data[i + 1] << 8 for i in range(lo, len(data) - 1)]
+    for m in _RUN_RE.finditer(data, lo):
+        base = 0x10000 | m.group(1)[0] << 9
+        end = m.end()
+        for i in range(m.start(), end - 1):
+            keys[i - lo] = base | min(end - i, MAX_MATCH + 1)
+    return keys
+
+def _parse(data, start, enc):
+    """
+    Encodes data[start:] into enc, data[:start] being the history. Finds the
+    longest match at every position through hash chains and picks the
+    cheapest parse from the back, so the output is as small as what
+    compress.c makes, give or take a few bytes where only a shorter match
+    than the longest would have been cheaper.
+
+    The chains aren't cut short. Every candidate is within the window, so
+    there are at most 256 of them, and low entropy data like runs of a few
+    symbols needs all of them to find the longest match.
+    """
+    end = len(data)
+    lo = max(start - MAX_MATCH, 0)
+    keys = _keys(data, lo)
+    head = {}
+    prev = {}
+    for i in range(lo, start):
+        key = keys[i - lo]
+        prev[i] = head.get(key)
+        head[key] = i
+
+    n = end - start
+    lens = [0] * n
+    dists = [0] * n
+    for i in range(start, end - 1):
+        limit = min(MAX_MATCH, end - i)
+        key = keys[i - lo]
+        j = head.get(key)
+        prev[i] = j
+        head[key] = i
+        best = 1
+        if key & 0x10000 and (j is None or i - j > MAX_MATCH) and i > lo:
+            # the first of its kind in a run still repeats the byte before
+            j = i - 1
+        while j is not None and i - j <= MAX_MATCH:
+            # the pair matches, only extend what could beat the best so far
+            if data[j + best] == data[i + best]:
+                l = _common_prefix(data, i, j, limit)
+                if l > best:
+                    best = l
+                    dists[i - start] = i - j
+                    if l == limit:
+                        break
+            j = prev.get(j)
+        if best > 1:
+            lens[i - start] = best
+
+    # cheapest encoding of every suffix
+    cost = [0] * (n + 1)
+    take = [0] * n
+    for i in range(n - 1, -1, -1):
+        c = cost[i + 1] + LITERAL_COST
+        l = lens[i]
+        if l:
+            seg = cost[i + 2:i + l + 1]
+            m = min(seg)
+            if m + MATCH_COST < c:
+                c = m + MATCH_COST
+                take[i] = seg.index(m) + 2
+        cost[i] = c
+
+    i = 0
+    while i < n:
+        l = take[i]
+        if l:
+            enc.ref(dists[i], l)
+            i += l
+        else:
+            enc.literal(data[start + i])
+            i += 1
+
+def compress(data):
+    """
+    Compresses a whole buffer with the hash chain parser.
+    """
+    enc = _Encoder()
+    _parse(bytes(data), 0, enc)
+    return enc.finish()
+
+class Compressor:
+    """
+    Streaming compressor, feed it chunks with compress() and call flush() at
+    the end. The input is parsed in blocks of block bytes, back references
+    reach into the previous block but don't cross into the next one.
+    """
+    def __init__(self, block=64 * 1024):
+        self.block = block
+        self._history = b""
+        self._pending = b""
+        self._enc = _Encoder()
+
+    def compress(self, data):
+        self._pending += bytes(data)
+        while len(self._pending) >= self.block:
+            self._run(self._pending[:self.block])
+            self._pending = self._pending[self.block:]
+        return self._enc.take()
+
+    def flush(self):
+        if self._pending:
+            self._run(self._pending)
+            self._pending = b""
+        return self._enc.finish()
+
+    def _run(self, block):
+        data = self._history + block
+        _parse(data, len(self._history), self._enc)
+        self._history = data[-MAX_MATCH:]
+
+def compress_file(fin, fout, chunk=1024*1024):
+    c = Compressor()
+    while True:
+        data = fin.read(chunk)
+        if not data:
+            break
+        fout.write(c.compress(data))
+    fout.write(c.flush())
+
+def main():
+    parser = argparse.ArgumentParser(description="rpi-eeprom-compress compatible (de)compressor")
+    parser.add_argument("-d", "--decompress", action="store_true")
+    parser.add_argument("--exact", action="store_true", help="compress exactly like compress.c, slower")
+    parser.add_argument("input", nargs="?", help="defaults to stdin")
+    parser.add_argument("output", nargs="?", help="defaults to stdout")
+    args = parser.parse_args()
+
+    fin = open(args.input, "rb") if args.input else sys.stdin.buffer
+    fout = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        if args.decompress:
+            decompress_file(fin, fout)
+        elif args.exact:
+            fout.write(compress_exact(fin.read()))
+        else:
+            compress_file(fin, fout)
+    except ValueError as err:
+        sys.stderr.write("%s\n" % err)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
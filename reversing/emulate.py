@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Runs RP1 firmware or a payload in the emulator from rp1/emu.py and lists
+the peripheral accesses it makes.
+
+    ./emulate.py ../payload/blinky/blinky.elf --ld ../payload/blinky/linker.ld --count 2000000
+    ./emulate.py rp1_fw_0x20000000.bin --entry 0x20000141 --timeout 1 --log
+
+Peripherals are modelled by rp1/sim.py, with every reset held like after
+power on unless --release is given.
+"""
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1 import regmap
+from rp1.emu import Emulator, format_access, layout
+from rp1.upload import read_image
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fw", help="ELF, or flat binary loaded at 0x20000000")
+    parser.add_argument("--entry", type=lambda x: int(x, 0),
+                        help="entry point, taken from the image by default")
+    parser.add_argument("--sp", type=lambda x: int(x, 0), help="initial SP, taken from the image by default")
+    parser.add_argument("--ld", help="linker script to take the memory layout from")
+    parser.add_argument("--rom", help="boot ROM dump, e.g. bootrom.bin from dump_bootrom.py")
+    parser.add_argument("--core", type=int, default=0, help="what the core ID register reads")
+    parser.add_argument("--release", action="store_true", help="release all resets before starting")
+    parser.add_argument("--count", type=int, default=0, help="instructions to run")
+    parser.add_argument("--timeout", type=float, default=0, help="seconds to run")
+    parser.add_argument("--until", type=lambda x: int(x, 0), default=0, help="stop when the PC gets here")
+    parser.add_argument("--log", action="store_true", help="print every access instead of a summary")
+    args = parser.parse_args()
+
+    if not (args.count or args.timeout or args.until):
+        parser.error("one of --count, --timeout or --until is needed, firmware doesn't return")
+
+    rom = open(args.rom, "rb").read() if args.rom else None
+    emu = Emulator(layout(args.ld) if args.ld else None, rom=rom, core=args.core)
+    if args.release:
+        for addr, val in regmap.release():
+            emu.sim.write32(addr, val)
+    image = read_image(open(args.fw, "rb").read(), args.entry, args.sp)
+    for addr, data in image.pieces:
+        emu.load(addr, data)
+    emu.boot(image.entry, image.sp)
+
+    start = time.perf_counter()
+    try:
+        emu.run(args.count, args.until, args.timeout)
+    except Exception as err:
+        # unicorn errors, e.g. unmapped accesses
+        print("stopped: %s" % err)
+    elapsed = time.perf_counter() - start
+    print("pc %08x after %.3fs, %d peripheral accesses" % (emu.pc, elapsed, len(emu.log)))
+
+    if args.log:
+        for a in emu.log:
+            print(format_access(a))
+        return
+
+    counts = collections.Counter((a.addr, a.write) for a in emu.log)
+    last = {a.addr: a.value for a in emu.log}
+    for addr in sorted({addr for addr, write in counts}):
+        print("%08x %-28s %7d reads %7d writes, last %08x" %
+              (addr, regmap.decode(addr), counts[addr, False], counts[addr, True], last[addr]))
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import mmap
+import os
 import sys
 import struct
 
@@ -32,40 +34,55 @@ def exit_error(msg):
     sys.exit(1)
 
 class ImageSection:
+    __slots__ = ('magic', 'offset', 'length', 'filename')
+
     def __init__(self, magic, offset, length, filename=''):
         self.magic = magic
         self.offset = offset
         self.length = length
         self.filename = filename
-        debug("ImageSection %x offset %d length %d %s" % (magic, offset, length, filename))
+
+    def __repr__(self):
+        return "ImageSection(%08x, %d, %d, %r)" % (self.magic, self.offset, self.length, self.filename)
 
 class BootloaderImage(object):
     def __init__(self, filename, output=None):
         """
         Instantiates a Bootloader image writer with a source eeprom (filename)
         and optionally an output filename.
+
+        The image is mapped copy-on-write, so updates never touch the source
+        file and only the pages that are actually read get loaded. The section
+        table is parsed on first use.
         """
         self._filename = filename
-        self._sections = []
+        self._sections = None
+        self._index = None
         self._image_size = 0
         try:
-            self._bytes = bytearray(open(filename, 'rb').read())
+            with open(filename, 'rb') as f:
+                self._image_size = os.fstat(f.fileno()).st_size
+                if self._image_size not in VALID_IMAGE_SIZES:
+                    exit_error("%s: Expected size %s bytes actual size %d bytes" %
+                               (filename, VALID_IMAGE_SIZES, self._image_size))
+                self._bytes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
         except IOError as err:
             exit_error("Failed to read \'%s\'\n%s\n" % (filename, str(err)))
-        self._out = None
-        if output is not None:
-            self._out = open(output, 'wb')
+        self._view = memoryview(self._bytes)
+        self._out = output
 
-        self._image_size = len(self._bytes)
-        if self._image_size not in VALID_IMAGE_SIZES:
-            exit_error("%s: Expected size %d bytes actual size %d bytes" %
-                       (filename, self._image_size, len(self._bytes)))
-        self.parse()
+    @property
+    def sections(self):
+        if self._sections is None:
+            self.parse()
+        return self._sections
 
     def parse(self):
         """
         Builds a table of offsets to the different sections in the EEPROM.
         """
+        self._sections = []
+        self._index = {}
         offset = 0
         magic = 0
         while offset < self._image_size:
@@ -81,7 +98,10 @@ class BootloaderImage(object):
                 filename = self._bytes[offset + 8: offset + FILE_HDR_LEN].decode('utf-8').replace('\0', '')
             else:
                 filename = f"{offset}.bin"
-            debug("section at %d length %d magic %08x %s" % (offset, length, magic, filename))
+            if DEBUG:
+                debug("section at %d length %d magic %08x %s" % (offset, length, magic, filename))
+            # the first section of a name wins, like it always did
+            self._index.setdefault(filename, len(self._sections))
             self._sections.append(ImageSection(magic, offset, length, filename))
 
             offset += 8 + length # length + type
@@ -96,31 +116,32 @@ class BootloaderImage(object):
         length = -1
         is_last = False
 
+        sections = self.sections
         next_offset = self._image_size - ERASE_ALIGN_SIZE # Don't create padding inside the bootloader scratch page
-        for i in range(0, len(self._sections)):
-            s = self._sections[i]
-            #if s.magic == FILE_MAGIC and s.filename == filename:
-            if s.filename == filename:
-                is_last = (i == len(self._sections) - 1)
-                offset = s.offset
-                length = s.length
-                break
-
-        # Find the start of the next non padding section
-        i += 1
-        while i < len(self._sections):
-            if self._sections[i].magic == PAD_MAGIC:
-                i += 1
-            else:
-                next_offset = self._sections[i].offset
-                break
+        i = self._index.get(filename)
+        if i is not None:
+            s = sections[i]
+            is_last = (i == len(sections) - 1)
+            offset = s.offset
+            length = s.length
+
+            # Find the start of the next non padding section
+            i += 1
+            while i < len(sections):
+                if sections[i].magic == PAD_MAGIC:
+                    i += 1
+                else:
+                    next_offset = sections[i].offset
+                    break
         ret = (offset, length, is_last, next_offset)
-        debug('%s offset %d length %d is-last %d next %d' % (filename, ret[0], ret[1], ret[2], ret[3]))
+        if DEBUG:
+            debug('%s offset %d length %d is-last %d next %d' % (filename, ret[0], ret[1], ret[2], ret[3]))
         return ret
 
-    def update(self, src_bytes, dst_filename):
+    def _check_update(self, src_bytes, dst_filename):
         """
-        Replaces a modifiable file with specified byte array.
+        Validates replacing dst_filename with src_bytes without touching the
+        image, returns what _apply_update() needs.
         """
         hdr_offset, length, is_last, next_offset = self.find_file(dst_filename)
         update_len = len(src_bytes) + FILE_HDR_LEN
@@ -134,19 +155,23 @@ class BootloaderImage(object):
         if hdr_offset + update_len > next_offset:
             raise Exception('Update %d bytes is larger than section size %d' % (update_len, next_offset - hdr_offset))
 
+        return hdr_offset, is_last, next_offset, src_bytes, dst_filename
+
+    def _apply_update(self, hdr_offset, is_last, next_offset, src_bytes, dst_filename):
         new_len = len(src_bytes) + FILENAME_LEN + 4
         struct.pack_into('>L', self._bytes, hdr_offset + 4, new_len)
-        struct.pack_into(("%ds" % len(src_bytes)), self._bytes,
-                         hdr_offset + 4 + FILE_HDR_LEN, src_bytes)
+        data_start = hdr_offset + 4 + FILE_HDR_LEN
+        self._bytes[data_start:data_start + len(src_bytes)] = src_bytes
+        self.sections[self._index[dst_filename]].length = new_len
 
         # If the new file is smaller than the old file then set any old
         # data which is now unused to all ones (erase value)
-        pad_start = hdr_offset + 4 + FILE_HDR_LEN + len(src_bytes)
+        pad_start = data_start + len(src_bytes)
 
         # Add padding up to 8-byte boundary
-        while pad_start % 8 != 0:
-            struct.pack_into('B', self._bytes, pad_start, 0xff)
-            pad_start += 1
+        aligned = (pad_start + 7) & ~7
+        self._bytes[pad_start:aligned] = b'\xff' * (aligned - pad_start)
+        pad_start = aligned
 
         # Create a padding section unless the padding size is smaller than the
         # size of a section head. Padding is allowed in the last section but
@@ -156,16 +181,37 @@ class BootloaderImage(object):
         pad_bytes = next_offset - pad_start
         if pad_bytes > 8 and not is_last:
             pad_bytes -= 8
-            struct.pack_into('>i', self._bytes, pad_start, PAD_MAGIC)
-            pad_start += 4
-            struct.pack_into('>i', self._bytes, pad_start, pad_bytes)
-            pad_start += 4
+            struct.pack_into('>ii', self._bytes, pad_start, PAD_MAGIC, pad_bytes)
+            pad_start += 8
 
         debug("pad %d" % pad_bytes)
-        pad = 0
-        while pad < pad_bytes:
-            struct.pack_into('B', self._bytes, pad_start + pad, 0xff)
-            pad = pad + 1
+        if pad_bytes > 0:
+            self._bytes[pad_start:pad_start + pad_bytes] = b'\xff' * pad_bytes
+
+    def update(self, src_bytes, dst_filename):
+        """
+        Replaces a modifiable file with specified byte array.
+        """
+        self._apply_update(*self._check_update(src_bytes, dst_filename))
+
+    def update_files(self, updates):
+        """
+        Replaces several files at once, updates maps destination filenames
+        to byte arrays (or is a list of such pairs). Every update is checked
+        before the first one is applied, so either all of them happen or
+        none.
+        """
+        if hasattr(updates, 'items'):
+            updates = updates.items()
+        checked = []
+        seen = set()
+        for dst_filename, src_bytes in updates:
+            if dst_filename in seen:
+                raise Exception('%s is updated more than once' % dst_filename)
+            seen.add(dst_filename)
+            checked.append(self._check_update(src_bytes, dst_filename))
+        for c in checked:
+            self._apply_update(*c)
 
     def update_key(self, src_pem, dst_filename):
         """
@@ -185,38 +231,57 @@ class BootloaderImage(object):
                             % (src_filename, len(src_bytes), MAX_FILE_SIZE))
         self.update(src_bytes, dst_filename)
 
+    def _write_out(self, data):
+        # written next to the target and renamed, the output may well be the
+        # file that is still mapped
+        tmp = self._out + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._out)
+
     def write(self):
         """
         Writes the updated EEPROM image to stdout or the specified output file.
         """
         if self._out is not None:
-            self._out.write(self._bytes)
-            self._out.close()
+            self._write_out(self._bytes)
         else:
             if hasattr(sys.stdout, 'buffer'):
                 sys.stdout.buffer.write(self._bytes)
             else:
                 sys.stdout.write(self._bytes)
 
+    @property
+    def data(self):
+        """
+        The whole image as a memoryview, without copying it.
+        """
+        return self._view
+
+    def section_data(self, s):
+        """
+        Returns the content of a section as a memoryview into the image,
+        without copying it.
+        """
+        offset = s.offset + 4 + FILE_HDR_LEN
+        return self._view[offset:offset+s.length-FILENAME_LEN-4]
+
     def get_file(self, filename):
         hdr_offset, length, is_last, next_offset = self.find_file(filename)
         offset = hdr_offset + 4 + FILE_HDR_LEN
-        file_bytes = self._bytes[offset:offset+length-FILENAME_LEN-4]
-        return file_bytes
+        return self._view[offset:offset+length-FILENAME_LEN-4]
 
     def extract_files(self):
-        for i in range(0, len(self._sections)):
-            s = self._sections[i]
+        for s in self.sections:
             #if s.magic == FILE_MAGIC:
             if True:
-                file_bytes = self.get_file(s.filename)
-                open(s.filename, 'wb').write(file_bytes)
+                with open(s.filename, 'wb') as f:
+                    f.write(self.section_data(s))
 
     def read(self):
         config_bytes = self.get_file('bootconf.txt')
         if self._out is not None:
-            self._out.write(config_bytes)
-            self._out.close()
+            self._write_out(config_bytes)
         else:
             if hasattr(sys.stdout, 'buffer'):
                 sys.stdout.buffer.write(config_bytes)
@@ -227,7 +292,7 @@ def main():
     i = BootloaderImage(sys.argv[1])
     i.extract_files()
     
-    #for s in i._sections:
+    #for s in i.sections:
     #    if s.magic != PAD_MAGIC and s.magic != FILE_MAGIC:
     #        print("section", s)
 
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+"""
+Pulls the RP1 firmware out of EEPROM images in one go: finds the compressed
+bootloader ELF among the sections, decompresses it and locates the firmware in
+its .rodata by the Cortex-M3 vector table at the start of the image.
+"""
+
+import argparse
+import collections
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1.elf import ELF, STT_OBJECT
+
+import extract
+from extract import BootloaderImage, FILE_MAGIC, PAD_MAGIC, exit_error
+from eeprom_compress import Decompressor, decompress
+
+# the firmware is linked to run from the start of SRAM
+FW_BASE = 0x20000000
+FW_MAX_SIZE = 128*1024
+
+# initial SP in local RAM (0x1000xxxx) or SRAM (0x2000xxxx) followed by a Thumb
+# reset vector in SRAM, as a lookahead so overlapping candidates are found too
+_ODD = re.escape(bytes(range(1, 256, 2)))
+_VECTORS_RE = re.compile(rb"(?=..[\x00-\x02][\x10\x20][" + _ODD + rb"].[\x00\x01]\x20)", re.S)
+
+# NMI up to SysTick
+NUM_VECTORS = 16
+
+Firmware = collections.namedtuple("Firmware", "offset size entry sp source")
+
+def find_loader(image):
+    """
+    Returns the section holding the compressed bootloader ELF and the
+    decompressed ELF, or (None, None).
+    """
+    for s in image.sections:
+        if s.magic in (FILE_MAGIC, PAD_MAGIC):
+            continue
+        data = image.section_data(s)
+        try:
+            head = Decompressor().decompress(data[:256])
+        except ValueError:
+            continue
+        if head.startswith(b"\x7fELF"):
+            return s, decompress(data)
+    return None, None
+
+def _in_image(ptr, size):
+    return ptr & 1 and FW_BASE <= ptr < FW_BASE + size
+
+def _check_vectors(words, size):
+    """
+    words starts with a candidate vector table, size is how much of the image
+    can be left from there. Every exception vector has to be unused or point
+    into the image.
+    """
+    if len(words) < NUM_VECTORS or words[0] & 3:
+        return False
+    if not _in_image(words[1], size):
+        return False
+    # NMI and HardFault are always populated
+    if not (_in_image(words[2], size) and _in_image(words[3], size)):
+        return False
+    return all(w == 0 or _in_image(w, size) for w in words[4:NUM_VECTORS])
+
+def _guess_size(words):
+    """
+    Follows the Thumb pointers from the vector table through the literal
+    pools of the code they point at, the last function found is the end of
+    the code. Whatever data follows it is included up to the first run of 8
+    zero words.
+    """
+    n = len(words)
+    end = NUM_VECTORS
+    scanned = 0
+    while scanned < end:
+        lo, scanned = scanned, end
+        for w in words[lo:scanned]:
+            if _in_image(w, n * 4):
+                end = max(end, ((w - FW_BASE) >> 2) + 1)
+
+    zeros = 0
+    while end + zeros < n and zeros < 8:
+        if words[end + zeros]:
+            end += zeros + 1
+            zeros = 0
+        else:
+            zeros += 1
+    return end * 4
+
+def _symbol_size(elf, offset):
+    # a symbol for the blob, should the ELF still have one
+    for sec_idx, s in enumerate(elf.sections):
+        if s.addr and s.offset <= offset < s.offset + s.size:
+            break
+    else:
+        return None
+    addr = offset - s.offset + s.addr
+    for sym in elf.symbols():
+        if sym.type == STT_OBJECT and sym.shndx == sec_idx and sym.value <= addr < sym.value + sym.size:
+            return sym.value + sym.size - addr
+    return None
+
+def locate_firmware(elf_data, offset=None, size=None):
+    """
+    Finds the firmware in the bootloader ELF. offset and size override what
+    is found. Returns a Firmware, offset being relative to the start of the
+    ELF file, or None.
+    """
+    data = memoryview(elf_data).cast("B")
+    elf = ELF(data)
+
+    if offset is None:
+        rodata = elf.section(".rodata")
+        start, end = (rodata.offset, rodata.offset + rodata.size) if rodata else (0, len(data))
+        for m in _VECTORS_RE.finditer(data[start:end]):
+            if m.start() & 3:
+                continue
+            cand = start + m.start()
+            limit = min(end - cand, FW_MAX_SIZE) & ~3
+            if _check_vectors(data[cand:cand + NUM_VECTORS * 4].cast("I"), limit):
+                offset = cand
+                break
+        else:
+            return None
+    else:
+        end = len(data)
+
+    words = data[offset:offset + (min(end - offset, FW_MAX_SIZE) & ~3)].cast("I")
+    source = "command line"
+    if size is None:
+        size = _symbol_size(elf, offset)
+        source = "symbol"
+    if size is None:
+        size = _guess_size(words)
+        source = "guess"
+    return Firmware(offset, size, words[1], words[0], source)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("images", nargs="+", help="pieeprom-*.bin")
+    parser.add_argument("-o", "--output",
+                        help="output file, {name} is replaced by the image name (default: "
+                             "rp1_fw_0x20000000.bin, {name}_rp1_fw.bin for more than one image)")
+    parser.add_argument("--loader", help="also write the decompressed bootloader ELF here, takes {name} too")
+    parser.add_argument("--offset", type=lambda x: int(x, 0), help="firmware offset in the ELF")
+    parser.add_argument("--size", type=lambda x: int(x, 0), help="firmware size")
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        output = "rp1_fw_0x20000000.bin" if len(args.images) == 1 else "{name}_rp1_fw.bin"
+    if len(args.images) > 1 and "{name}" not in output:
+        exit_error("--output needs {name} for more than one image")
+
+    extract.DEBUG = False
+    failed = 0
+    for path in args.images:
+        name = os.path.splitext(os.path.basename(path))[0]
+        image = BootloaderImage(path)
+        s, elf = find_loader(image)
+        if s is None:
+            sys.stderr.write("%s: no compressed bootloader ELF found\n" % path)
+            failed += 1
+            continue
+        if args.loader:
+            open(args.loader.format(name=name), "wb").write(elf)
+
+        fw = locate_firmware(elf, args.offset, args.size)
+        if fw is None:
+            sys.stderr.write("%s: no firmware found in bootloader ELF (section %s)\n" % (path, s.filename))
+            failed += 1
+            continue
+
+        out = output.format(name=name)
+        open(out, "wb").write(memoryview(elf)[fw.offset:fw.offset + fw.size])
+        print("%s: firmware at %#x in ELF from section %s, %#x bytes (size from %s) -> %s" %
+              (path, fw.offset, s.filename, fw.size, fw.source, out))
+        print("    --entry %#x --sp %#x" % (fw.entry, fw.sp))
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,16 @@
 git clone https://github.com/raspberrypi/rpi-eeprom.git && cd rpi-eeprom && git checkout 5ec5c003bacc73847aadad712aa1fbdace8f1c4e && cd ..
 #git clone https://git.venev.name/hristo/rpi-eeprom-compress.git
 
-cd rpi-eeprom-compress && make && cd ..
-
+# all sections, for reference
 mkdir extracted && cd extracted
 ../extract.py ../rpi-eeprom/firmware-2712/latest/pieeprom-2023-10-18.bin
-cat 68272.bin | ../rpi-eeprom-compress/uncompress > ../loader.elf
 cd ..
 
-dd if=loader.elf of=rp1_fw_0x20000000.bin bs=1 skip=$((0x725f4)) count=$((0x6570))
+# finds and decompresses the bootloader ELF (68272.bin) and locates the firmware in it
+./extract_fw.py --loader loader.elf rpi-eeprom/firmware-2712/latest/pieeprom-2023-10-18.bin
+
+# or for every release at once
+#mkdir -p fw && ./extract_fw.py -o "fw/{name}.bin" rpi-eeprom/firmware-2712/*/pieeprom-*.bin
+
+# or index every release, with deduplicated sections, into corpus/
+#./corpus.py index rpi-eeprom/firmware-2712
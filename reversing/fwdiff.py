@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+"""
+Diffs two RP1 firmware images, or one against every firmware in a corpus.
+
+The images are aligned by anchoring on blocks of the first image that occur
+exactly once, found in the second one at any halfword offset, and growing
+the matches in both directions. Before matching, SRAM pointers in literal
+pools and the offsets of BL instructions are masked out, so code that only
+moved around still lines up.
+
+Reported are the regions that don't match, literal pool entries and calls
+in matching code that point somewhere else than the moved target would be
+and the MMIO addresses in the peripheral range that only one image uses.
+"""
+
+import argparse
+import bisect
+import collections
+import os
+import re
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from corpus import Corpus
+from rp1.regmap import decode
+
+FW_BASE = 0x20000000
+
+MMIO_BASE = 0x40000000
+MMIO_END = 0x40400000
+
+BLOCK = 32
+
+# a word pointing into the first 128K of SRAM
+_PTR_RE = re.compile(rb"(?=..[\x00\x01]\x20)", re.S)
+# 32 bit BL/BLX: 11110xxx xxxxxxxx 11x1xxxx xxxxxxxx, as little endian halfwords
+_BL_RE = re.compile(rb"(?=.[\xf0-\xf7].[\xd0-\xdf\xf0-\xff])", re.S)
+
+# a word between MMIO_BASE and MMIO_END
+_MMIO_RE = re.compile(rb"(?=..[\x00-\x3f]\x40)", re.S)
+
+Match = collections.namedtuple("Match", "a b length")
+Region = collections.namedtuple("Region", "a a_len b b_len moved")
+Change = collections.namedtuple("Change", "kind a b old new")
+
+def bl_target(data, pos):
+    """
+    Image offset a BL/BLX at pos calls.
+    """
+    hw1, hw2 = struct.unpack_from("<HH", data, pos)
+    s = (hw1 >> 10) & 1
+    i1 = ~((hw2 >> 13) ^ s) & 1
+    i2 = ~((hw2 >> 11) ^ s) & 1
+    imm = (s << 24) | (i1 << 23) | (i2 << 22) | ((hw1 & 0x3ff) << 12) | ((hw2 & 0x7ff) << 1)
+    if s:
+        imm -= 1 << 25
+    target = pos + 4 + imm
+    if not hw2 & 0x1000:
+        # BLX switches to ARM, the target is word aligned
+        target &= ~3
+    return target
+
+class FirmwareIndex:
+    """
+    An image prepared for diffing: the masked copy, where the pointers and
+    calls are and the unique blocks to anchor on.
+    """
+    def __init__(self, data, block=BLOCK):
+        self.data = bytes(data)
+        self.block = block
+        norm = bytearray(self.data)
+
+        self.ptrs = [m.start() for m in _PTR_RE.finditer(self.data) if not m.start() & 3]
+        for p in self.ptrs:
+            norm[p:p + 4] = b"\x00\x00\x00\x20"
+
+        self.bls = []
+        end = 0
+        for m in _BL_RE.finditer(self.data):
+            p = m.start()
+            if p & 1 or p < end or p + 4 > len(self.data):
+                continue
+            self.bls.append(p)
+            norm[p:p + 4] = b"\x00\xf0\x00\xf8"
+            end = p + 4
+        self.norm = bytes(norm)
+
+        self.mmio = collections.defaultdict(list)
+        for m in _MMIO_RE.finditer(self.data):
+            p = m.start()
+            if not p & 3:
+                self.mmio[struct.unpack_from("<I", self.data, p)[0]].append(p)
+
+        # blocks at every halfword, the ones occurring more than once can't anchor
+        blocks = {}
+        nb = self.norm
+        for i in range(0, len(nb) - block + 1, 2):
+            k = nb[i:i + block]
+            blocks[k] = -1 if k in blocks else i
+        self.blocks = blocks
+
+def _extend(a, b, i, j, n, m):
+    """
+    Length of the common run of a[i:] and b[j:].
+    """
+    k = 0
+    step = 64
+    while step:
+        while i + k + step <= n and j + k + step <= m and a[i + k:i + k + step] == b[j + k:j + k + step]:
+            k += step
+        step >>= 1
+    return k
+
+def _match(ia, ib):
+    """
+    Matches of ib in ia, in order of ib, not overlapping in ib.
+    """
+    a, b = ia.norm, ib.norm
+    n, m = len(a), len(b)
+    blocks = ia.blocks
+    block = ia.block
+    matches = []
+    j = 0
+    b_end = 0
+    while j + block <= m:
+        i = blocks.get(b[j:j + block], -1)
+        if i < 0:
+            j += 2
+            continue
+        # grow backwards up to the last match
+        a_end = 0
+        if matches and matches[-1].a <= i:
+            a_end = matches[-1].a + matches[-1].length
+        back = 0
+        while i - back > a_end and j - back > b_end and a[i - back - 1] == b[j - back - 1]:
+            back += 1
+        i -= back
+        j -= back
+        length = _extend(a, b, i, j, n, m)
+        matches.append(Match(i, j, length))
+        j += length
+        b_end = j
+    return matches
+
+class Diff:
+    def __init__(self, ia, ib):
+        self.a = ia
+        self.b = ib
+        self.matches = _match(ia, ib)
+        self.same = sum(m.length for m in self.matches)
+        self._by_a = sorted(self.matches)
+        self._a_starts = [m.a for m in self._by_a]
+
+        self.regions = self._regions()
+        self.changes = self._changes()
+        self.mmio_removed = sorted(set(ia.mmio) - set(ib.mmio))
+        self.mmio_added = sorted(set(ib.mmio) - set(ia.mmio))
+
+    def map(self, off):
+        """
+        Where offset off of the first image ended up in the second, or None.
+        """
+        k = bisect.bisect_right(self._a_starts, off) - 1
+        if k < 0:
+            return None
+        m = self._by_a[k]
+        if off >= m.a + m.length:
+            return None
+        return off - m.a + m.b
+
+    def _regions(self):
+        regions = []
+        a_end = b_end = 0
+        n, m = len(self.a.data), len(self.b.data)
+        for match in self.matches + [Match(n, m, 0)]:
+            b_len = match.b - b_end
+            if match.a >= a_end:
+                if match.a > a_end or b_len:
+                    regions.append(Region(a_end, match.a - a_end, b_end, b_len, False))
+                a_end = match.a + match.length
+            else:
+                # matched further back in a than the previous match
+                if b_len:
+                    regions.append(Region(a_end, 0, b_end, b_len, False))
+                regions.append(Region(match.a, match.length, match.b, match.length, True))
+            b_end = match.b + match.length
+        # what went missing from a because it moved isn't gone
+        moved = [(r.a, r.a + r.a_len) for r in regions if r.moved]
+        return [r for r in regions if r.moved or r.b_len or
+                not any(start <= r.a and r.a + r.a_len <= end for start, end in moved)]
+
+    def _changes(self):
+        """
+        Literal pool entries and calls in matching code that differ by more
+        than the code moving.
+        """
+        changes = []
+        da, db = self.a.data, self.b.data
+        for p in self.a.ptrs:
+            q = self.map(p)
+            if q is None or self.map(p + 3) != q + 3:
+                continue
+            old, = struct.unpack_from("<I", da, p)
+            new, = struct.unpack_from("<I", db, q)
+            if old == new:
+                continue
+            target = self.map((old & ~1) - FW_BASE)
+            if target is None or target + FW_BASE + (old & 1) != new:
+                changes.append(Change("literal", p, q, old, new))
+        for p in self.a.bls:
+            q = self.map(p)
+            if q is None or self.map(p + 3) != q + 3:
+                continue
+            old = bl_target(da, p)
+            new = bl_target(db, q)
+            # data that happens to look like a BL points anywhere
+            if old == new or not 0 <= old < len(da):
+                continue
+            target = self.map(old)
+            if target is None or target != new:
+                changes.append(Change("call", p, q, old + FW_BASE, new + FW_BASE))
+        changes.sort(key=lambda c: c.a)
+        return changes
+
+    @property
+    def similarity(self):
+        return self.same / max(len(self.a.data), len(self.b.data), 1)
+
+def _mmio_users(index, addr):
+    return ", ".join("%#x" % (p + FW_BASE) for p in index.mmio[addr][:4])
+
+def print_diff(d, a_name="a", b_name="b"):
+    print("%s: %d bytes, %s: %d bytes, %d bytes matching (%.1f%%) in %d blocks" %
+          (a_name, len(d.a.data), b_name, len(d.b.data), d.same, d.similarity * 100, len(d.matches)))
+
+    if d.regions:
+        print("\nchanged regions:")
+    for r in d.regions:
+        if r.moved:
+            what = "moved "
+        elif not r.a_len:
+            what = "added "
+        elif not r.b_len:
+            what = "gone  "
+        else:
+            what = "change"
+        print("  %s %08x+%-5x -> %08x+%-5x" % (what, r.a + FW_BASE, r.a_len, r.b + FW_BASE, r.b_len))
+
+    if d.changes:
+        print("\nchanged literals and calls:")
+    for c in d.changes:
+        print("  %-7s at %08x/%08x: %08x -> %08x" % (c.kind, c.a + FW_BASE, c.b + FW_BASE, c.old, c.new))
+
+    if d.mmio_removed or d.mmio_added:
+        print("\nMMIO addresses:")
+    for addr in d.mmio_removed:
+        print("  - %08x %-24s used at %s" % (addr, decode(addr), _mmio_users(d.a, addr)))
+    for addr in d.mmio_added:
+        print("  + %08x %-24s used at %s" % (addr, decode(addr), _mmio_users(d.b, addr)))
+
+def diff_corpus(corpus, data, block=BLOCK):
+    """
+    Diffs data against every distinct firmware in the corpus. Returns a list
+    of (Diff, releases) sorted by similarity.
+    """
+    releases = collections.defaultdict(list)
+    for name, entry in corpus.releases.items():
+        fw = entry.get("firmware")
+        if fw is not None:
+            releases[fw["hash"]].append(name)
+
+    ia = FirmwareIndex(data, block)
+    results = []
+    for h, names in releases.items():
+        results.append((Diff(ia, FirmwareIndex(corpus.read_blob(h), block)), sorted(names)))
+    results.sort(key=lambda r: -r[0].similarity)
+    return results
+
+def _load(path, corpus):
+    if os.path.exists(path):
+        return open(path, "rb").read()
+    if corpus is not None and path in corpus.releases:
+        data = corpus.firmware(path)
+        if data is not None:
+            return data
+    sys.stderr.write("%s: neither a file nor a release with firmware in the corpus\n" % path)
+    sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("a", help="firmware file or release in the corpus")
+    parser.add_argument("b", nargs="?", help="firmware file or release, left out to diff against the whole corpus")
+    parser.add_argument("--corpus", help="corpus directory from corpus.py")
+    parser.add_argument("--block", type=int, default=BLOCK, help="anchor block size (default: %(default)d)")
+    args = parser.parse_args()
+
+    corpus = Corpus(args.corpus) if args.corpus else None
+    a = _load(args.a, corpus)
+
+    if args.b is not None:
+        b = _load(args.b, corpus)
+        print_diff(Diff(FirmwareIndex(a, args.block), FirmwareIndex(b, args.block)), args.a, args.b)
+        return
+
+    if corpus is None:
+        parser.error("either b or --corpus is needed")
+    for d, names in diff_corpus(corpus, a, args.block):
+        print("%5.1f%% %3d regions %3d literals/calls %3d MMIO  %s" %
+              (d.similarity * 100, len(d.regions), len(d.changes),
+               len(d.mmio_removed) + len(d.mmio_added), " ".join(names)))
+
+if __name__ == "__main__":
+    main()
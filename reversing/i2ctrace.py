@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""
+Looks at traces of the bootstrap bus, as written by resets.py and
+dump_bootrom.py with --trace, and replays them against the simulated RP1.
+
+    ./dump_bootrom.py --trace rom.trace
+    ./i2ctrace.py stats rom.trace
+    ./i2ctrace.py replay rom.trace -o sim.trace
+    ./i2ctrace.py stats rom.trace sim.trace
+
+Replaying reproduces the run offline: the same transfers in the same order,
+so the simulated side can be profiled or a transport change timed against
+the recorded run.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1 import regmap
+from rp1.sim import SimRP1
+from rp1.trace import READ, RunEvent, compare, histogram, percentile, read_trace, replay, summarize
+
+def us(ns):
+    return ns / 1000
+
+def print_stats(name, records):
+    xfers = [r for r in records if r.__class__ is not RunEvent]
+    print("%s: %d transfers" % (name, len(xfers)))
+    if not xfers:
+        return
+    span = xfers[-1].end - xfers[0].start
+    busy = sum(t.end - t.start for t in xfers)
+    print("  %.3fs from first to last, %.3fs of it in transfers (%.0f%%)" %
+          (span / 1e9, busy / 1e9, busy / span * 100 if span else 100))
+
+    for op, s in summarize(records).items():
+        rate = (s.written + s.read) / (s.busy / 1e9) / 1024 if s.busy else 0
+        print("  %-10s %7d transfers %8d msgs %9d bytes written %9d read  %8.1f KiB/s  %d failed%s" %
+              (op, s.count, s.msgs, s.written, s.read, rate, s.failed,
+               "".join(" (errno %d: %d)" % e for e in sorted(s.errnos.items()))))
+        print("             mean %.1f us, p50 %.1f us, p90 %.1f us, p99 %.1f us, max %.1f us" %
+              (us(s.busy / s.count), us(percentile(s.latencies, 50)), us(percentile(s.latencies, 90)),
+               us(percentile(s.latencies, 99)), us(s.latencies[-1])))
+        buckets = histogram(s.latencies)
+        most = max(c for _, _, c in buckets)
+        for lo, hi, c in buckets:
+            print("    %9.1f - %9.1f us %7d %s" % (us(lo), us(hi), c, "#" * ((c * 40 + most - 1) // most)))
+
+def stats(args):
+    for path in args.traces:
+        print_stats(path, read_trace(path)[3])
+
+def show(args):
+    started, max_msgs, read_data, records = read_trace(args.trace)
+    for r in records[:args.limit or None]:
+        if r.__class__ is RunEvent:
+            print("%12.6f RUN %d" % (r.time / 1e9, r.value))
+            continue
+        print("%12.6f %8.1f us %d msgs%s" % (r.start / 1e9, us(r.end - r.start), len(r.msgs),
+                                            " errno %d" % r.errno if r.errno else ""))
+        if args.msgs:
+            for m in r.msgs:
+                print("    %s %08x %-28s %3d %s" % ("r" if m.dir == READ else "w", m.addr,
+                                                  regmap.decode(m.addr), m.length, m.data[:16].hex()))
+
+def do_replay(args):
+    started, max_msgs, read_data, records = read_trace(args.trace)
+    rom = open(args.rom, "rb").read() if args.rom else None
+    sim = SimRP1(rom, rom_flip_rate=args.flip_rate)
+    out = open(args.output, "wb") if args.output else None
+    replayed = replay(records, sim, sim, out, read_data)
+    if out is not None:
+        out.close()
+
+    print_stats(args.trace, records)
+    print_stats("replay", replayed)
+    if sim.max_msgs >= max_msgs:
+        print("%d transfers came out differently" % compare(records, replayed))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd")
+
+    p = sub.add_parser("stats", help="latency histograms and throughput per operation")
+    p.add_argument("traces", nargs="+")
+    p.set_defaults(func=stats)
+
+    p = sub.add_parser("show", help="list the transfers")
+    p.add_argument("trace")
+    p.add_argument("--msgs", action="store_true", help="also list the messages of every transfer")
+    p.add_argument("--limit", type=int, default=0, help="only the first this many records")
+    p.set_defaults(func=show)
+
+    p = sub.add_parser("replay", help="replay a trace against the simulated RP1")
+    p.add_argument("trace")
+    p.add_argument("-o", "--output", help="write a trace of the replay")
+    p.add_argument("--rom", help="boot ROM for the simulation, e.g. bootrom.bin from dump_bootrom.py")
+    p.add_argument("--flip-rate", type=float, default=0.0, help="chance of a flipped bit per byte of ROM reads")
+    p.set_defaults(func=do_replay)
+
+    args = parser.parse_args()
+    if args.cmd is None:
+        parser.print_help()
+        return
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+"""
+Lists the peripheral registers the RP1 firmware touches, found statically.
+
+A first pass finds every PC relative load (ldr rX, [pc, #imm] in both
+encodings) and indexes the literal pool words they load. The second pass
+walks the code, skipping the pools, and follows the registers loaded with a
+peripheral address (or built with movw/movt) into the ldr/str instructions
+that use them as a base. Registers are forgotten again after a few
+instructions or when they are loaded with something else, nothing here
+knows about control flow.
+
+Addresses that are loaded but never seen as a base are listed as references,
+they are often handed to functions.
+"""
+
+import argparse
+import collections
+import csv
+import os
+import sys
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1.regmap import ALIAS_NAMES, PERIPH_BASE, lookup
+
+FW_BASE = 0x20000000
+
+MMIO_BASE = PERIPH_BASE
+MMIO_END = PERIPH_BASE + 0x400000
+
+# how many instructions a loaded base register is believed to survive
+TRACK_WINDOW = 12
+
+Access = collections.namedtuple("Access", "addr kind width pc")
+
+def _is32(hw):
+    return (hw >> 11) in (0x1d, 0x1e, 0x1f)
+
+def literal_pool(hws):
+    """
+    Indexes the PC relative loads: returns {literal halfword index: value
+    loaded} and {instruction halfword index: (register, value)}.
+    """
+    pool = {}
+    loads = {}
+    n = len(hws)
+    i = 0
+    while i < n:
+        hw = hws[i]
+        if (hw & 0xf800) == 0x4800:
+            # ldr rt, [pc, #imm8 * 4]
+            rt = (hw >> 8) & 7
+            lit = ((i * 2 + 4) & ~3) + (hw & 0xff) * 4
+        elif (hw & 0xff7f) == 0xf85f and i + 1 < n:
+            # ldr.w rt, [pc, #+-imm12]
+            hw2 = hws[i + 1]
+            rt = hw2 >> 12
+            imm = hw2 & 0xfff
+            lit = ((i * 2 + 4) & ~3) + (imm if hw & 0x80 else -imm)
+        else:
+            i += 2 if _is32(hw) else 1
+            continue
+        if 0 <= lit and lit + 4 <= n * 2:
+            val = hws[lit >> 1] | (hws[(lit >> 1) + 1] << 16)
+            pool[lit >> 1] = val
+            pool[(lit >> 1) + 1] = val
+            loads[i] = (rt, val)
+        i += 2 if _is32(hw) else 1
+    return pool, loads
+
+def _movw_imm(hw, hw2):
+    return ((hw & 0xf) << 12) | (((hw >> 10) & 1) << 11) | (((hw2 >> 12) & 7) << 8) | (hw2 & 0xff)
+
+# 16 bit ldr/str (immediate): opcode bits -> (kind, width)
+_LDST16 = {
+    0x6000: ("write", 4), 0x6800: ("read", 4),
+    0x7000: ("write", 1), 0x7800: ("read", 1),
+    0x8000: ("write", 2), 0x8800: ("read", 2),
+}
+# 32 bit ldr/str: bits 6:4 of the first halfword -> (kind, width)
+_LDST32 = {
+    0x0: ("write", 1), 0x1: ("read", 1),
+    0x2: ("write", 2), 0x3: ("read", 2),
+    0x4: ("write", 4), 0x5: ("read", 4),
+}
+
+def scan(data):
+    """
+    Returns the list of MMIO Accesses in data and the peripheral addresses
+    loaded from literal pools as {address: [pc, ...]}.
+    """
+    data = bytes(data)
+    hws = array("H", data[:len(data) & ~1])
+    if sys.byteorder != "little":
+        hws.byteswap()
+    pool, loads = literal_pool(hws)
+
+    accesses = []
+    refs = collections.defaultdict(list)
+    regs = {}   # register -> (value, halfword index it was set at)
+    n = len(hws)
+    i = 0
+    while i < n:
+        if i in pool:
+            i += 1
+            continue
+        hw = hws[i]
+        pc = FW_BASE + i * 2
+        wide = _is32(hw) and i + 1 < n
+
+        if i in loads:
+            rt, val = loads[i]
+            if MMIO_BASE <= val < MMIO_END:
+                regs[rt] = (val, i)
+                refs[val].append(pc)
+            else:
+                regs.pop(rt, None)
+        elif not wide and (hw & 0xf000) in (0x6000, 0x7000, 0x8000):
+            kind, width = _LDST16[hw & 0xf800]
+            rn = (hw >> 3) & 7
+            rt = hw & 7
+            base = regs.get(rn)
+            if base is not None and i - base[1] <= TRACK_WINDOW:
+                accesses.append(Access(base[0] + ((hw >> 6) & 0x1f) * width, kind, width, pc))
+            if kind == "read":
+                regs.pop(rt, None)
+        elif wide and (hw & 0xff00) == 0xf800 and ((hw >> 4) & 0x7) in _LDST32 and (hw & 0xf) != 0xf:
+            kind, width = _LDST32[(hw >> 4) & 0x7]
+            hw2 = hws[i + 1]
+            rn = hw & 0xf
+            rt = hw2 >> 12
+            off = None
+            if hw & 0x80:
+                off = hw2 & 0xfff
+            elif (hw2 & 0x0f00) == 0x0c00:
+                # imm8 with P=1, W=0, negative offsets
+                off = -(hw2 & 0xff)
+            elif (hw2 & 0x0f00) == 0x0e00:
+                off = hw2 & 0xff
+            base = regs.get(rn)
+            if off is not None and base is not None and i - base[1] <= TRACK_WINDOW:
+                accesses.append(Access(base[0] + off, kind, width, pc))
+            if kind == "read":
+                regs.pop(rt, None)
+        elif wide and (hw & 0xfbf0) == 0xf240:
+            # movw
+            hw2 = hws[i + 1]
+            regs[(hw2 >> 8) & 0xf] = (_movw_imm(hw, hw2), i)
+        elif wide and (hw & 0xfbf0) == 0xf2c0:
+            # movt
+            hw2 = hws[i + 1]
+            rd = (hw2 >> 8) & 0xf
+            low = regs.get(rd, (0, i))[0] & 0xffff
+            val = (_movw_imm(hw, hw2) << 16) | low
+            if MMIO_BASE <= val < MMIO_END:
+                regs[rd] = (val, i)
+                refs[val].append(pc)
+            else:
+                regs.pop(rd, None)
+
+        i += 2 if wide else 1
+    return accesses, refs
+
+def _name(addr):
+    loc = lookup(addr)
+    if loc is None:
+        return "%08x" % (addr & ~0x3fff), "", addr & 0x3fff, ""
+    return loc.block.name, loc.reg.name if loc.reg else "", loc.offset, ALIAS_NAMES[loc.alias]
+
+def table(accesses, refs):
+    """
+    Rows of (address, peripheral, register, offset, alias, reads, writes,
+    refs, widths, pcs), sorted by address.
+    """
+    per_addr = collections.defaultdict(list)
+    for a in accesses:
+        per_addr[a.addr].append(a)
+    for addr in refs:
+        per_addr.setdefault(addr, [])
+
+    rows = []
+    for addr in sorted(per_addr):
+        acc = per_addr[addr]
+        name, reg, off, alias = _name(addr)
+        rows.append((addr, name, reg, off, alias,
+                     sum(a.kind == "read" for a in acc), sum(a.kind == "write" for a in acc),
+                     len(refs.get(addr, ())), sorted({a.width for a in acc}), [a.pc for a in acc]))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("firmware", nargs="?", default="rp1_fw_0x20000000.bin")
+    parser.add_argument("--csv", action="store_true", help="CSV output with all instruction addresses")
+    parser.add_argument("--accessed", action="store_true", help="leave out addresses that are only referenced")
+    args = parser.parse_args()
+
+    rows = table(*scan(open(args.firmware, "rb").read()))
+    if args.accessed:
+        rows = [r for r in rows if r[5] or r[6]]
+
+    if args.csv:
+        w = csv.writer(sys.stdout)
+        w.writerow(["address", "peripheral", "register", "offset", "alias", "reads", "writes", "refs", "widths", "pcs"])
+        for addr, name, reg, off, alias, reads, writes, nrefs, widths, pcs in rows:
+            w.writerow(["%08x" % addr, name, reg, "%#05x" % off, alias, reads, writes, nrefs,
+                        " ".join(map(str, widths)), " ".join("%08x" % pc for pc in pcs)])
+        return
+
+    print("%-8s  %-20s %-16s %-6s %-3s %5s %5s %4s  %s" %
+          ("address", "peripheral", "register", "offset", "", "reads", "writes", "refs", "at"))
+    for addr, name, reg, off, alias, reads, writes, nrefs, widths, pcs in rows:
+        at = " ".join("%x" % pc for pc in pcs[:4]) + (" ..." if len(pcs) > 4 else "")
+        print("%08x  %-20s %-16s %#06x %-3s %5d %5d %4d  %s" % (addr, name, reg, off, alias, reads, writes, nrefs, at))
+
+if __name__ == "__main__":
+    main()
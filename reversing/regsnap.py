@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Takes snapshots of the RP1 peripheral registers and diffs them, to see what
+the firmware or a driver changed between two points in time.
+
+Captures read the first 4K (below the atomic aliases) of every block that is
+safe to read, see DONT_PROBE in rp1/regmap.py, over the bootstrap I2C
+interface or through the PCIe BARs from /dev/mem.
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1 import regmap
+from rp1.hexdump import hexdump, registers
+from rp1.snapshot import DEFAULT_SPAN, Snapshot, diff, format_change
+
+def capture(args):
+    if args.blocks:
+        blocks = [regmap.block(name) for name in args.blocks.split(",")]
+    else:
+        blocks = regmap.PROBE_BLOCKS
+
+    if args.pcie:
+        from rp1.pcie import RP1Bars, RP1_BAR1_LEN
+        # BAR1 ends before EXAC
+        snap = Snapshot.of_blocks([b for b in blocks if b.addr - regmap.PERIPH_BASE < RP1_BAR1_LEN], args.span)
+        bars = RP1Bars()
+        try:
+            snap.capture_bars(bars)
+        finally:
+            bars.close()
+    else:
+        from rp1.bootstrap import Bootstrap
+        snap = Snapshot.of_blocks(blocks, args.span)
+        snap.capture_i2c(Bootstrap())
+
+    snap.save(args.output)
+    print("%d blocks, %d bytes -> %s" % (len(snap.regions), len(snap.data), args.output))
+
+def show(args):
+    snap = Snapshot.load(args.snapshot)
+    taken = datetime.datetime.fromtimestamp(snap.taken).isoformat(" ", "seconds") if snap.taken else "?"
+    print("%s, over %s, %d bytes" % (taken, snap.source or "?", len(snap.data)))
+    for i, (name, addr, length) in enumerate(snap.regions):
+        region = snap.region(i)
+        if args.dump:
+            print("\n%s:" % name)
+            hexdump(region, addr, registers).write(sys.stdout)
+            continue
+        nonzero = sum(1 for w in region[:length & ~3].cast("I") if w)
+        print("  %-20s %08x+%-5x %4d words set" % (name, addr, length, nonzero))
+
+def show_diff(args):
+    a = Snapshot.load(args.a)
+    b = Snapshot.load(args.b)
+    ignore = {regmap.addr(name) for name in args.ignore}
+    changes = diff(a, b, ignore)
+    for addr, old, new in changes:
+        print(format_change(addr, old, new))
+    print("%d registers changed" % len(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd")
+
+    p = sub.add_parser("capture", help="take a snapshot")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--pcie", action="store_true", help="read the BARs instead of using the bootstrap interface")
+    p.add_argument("--blocks", help="comma separated blocks to capture instead of all that are safe to read")
+    p.add_argument("--span", type=lambda x: int(x, 0), default=DEFAULT_SPAN,
+                   help="bytes per block (default: %(default)#x)")
+    p.set_defaults(func=capture)
+
+    p = sub.add_parser("diff", help="list the registers that differ between two snapshots")
+    p.add_argument("a")
+    p.add_argument("b")
+    p.add_argument("--ignore", action="append", default=[], metavar="BLOCK.REG",
+                   help="leave out a register, e.g. a timer")
+    p.set_defaults(func=show_diff)
+
+    p = sub.add_parser("show", help="what is in a snapshot")
+    p.add_argument("snapshot")
+    p.add_argument("--dump", action="store_true", help="hexdump the blocks, with register names")
+    p.set_defaults(func=show)
+
+    args = parser.parse_args()
+    if args.cmd is None:
+        parser.print_help()
+        return
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+SQLite store for resets.py runs.
+
+Everything a run learns goes in here as soon as it is known: the groups of
+reset bits that still have to be tested, what every bit does and which bits
+kill the bootstrap bus. A run that dies can pick up where it left off, and the
+results can be queried afterwards.
+"""
+
+import sqlite3
+
+SCHEMA = """
+create table if not exists meta (key text primary key, value);
+create table if not exists pending (id integer primary key, bits text not null, testing integer not null default 0);
+create table if not exists findings (reg integer, bit integer, peripheral text, offset integer, before integer, after integer);
+create table if not exists skips (reg integer, bit integer, reason text, primary key (reg, bit));
+"""
+
+def _encode(bits):
+    return " ".join(f"{reg}:{bit}" for reg, bit in bits)
+
+def _decode(s):
+    return [tuple(int(x) for x in b.split(":")) for b in s.split()]
+
+class ResetDB:
+    def __init__(self, path=":memory:"):
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def get(self, key, default=None):
+        row = self._db.execute("select value from meta where key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set(self, key, value):
+        self._db.execute("insert or replace into meta values (?, ?)", (key, value))
+
+    def start(self, candidates, span, chunk):
+        """
+        Starts a run over the candidate (reset reg, bit) pairs, unless the
+        database already holds one. Refuses to resume a run with other
+        parameters.
+        """
+        if self.get("started"):
+            if (self.get("span"), self.get("chunk")) != (span, chunk):
+                raise ValueError("database holds a run with span %#x and chunk %d" %
+                                 (self.get("span"), self.get("chunk")))
+            return False
+        with self._db:
+            self._set("started", 1)
+            self._set("span", span)
+            self._set("chunk", chunk)
+            self._set("tests", 0)
+            self._db.execute("insert into pending (bits) values (?)", (_encode(candidates),))
+        return True
+
+    def next_group(self):
+        """
+        Returns (id, bits, interrupted) of the next group to test, or None when
+        the run is done. interrupted is how many runs stopped, for whatever
+        reason, while testing the group.
+        """
+        row = self._db.execute("select id, bits, testing from pending order by id desc limit 1").fetchone()
+        if row is None:
+            return None
+        return row[0], _decode(row[1]), row[2]
+
+    def mark_testing(self, group_id):
+        # counts the attempts, finish() removes the group, so whatever is
+        # left here when the next run starts is the number of interruptions
+        with self._db:
+            self._db.execute("update pending set testing = testing + 1 where id = ?", (group_id,))
+
+    def finish(self, group_id, split=(), findings=(), skip=None):
+        """
+        Retires a tested group in one transaction: the groups it was split
+        into are queued, findings are (reg, bit, peripheral, offset, before,
+        after) and skip is a (reg, bit, reason) for a bit that must not be
+        touched again.
+        """
+        with self._db:
+            self._db.execute("delete from pending where id = ?", (group_id,))
+            # queued in reverse, the first group is tested first
+            for bits in reversed(split):
+                self._db.execute("insert into pending (bits) values (?)", (_encode(bits),))
+            self._db.executemany("insert into findings values (?, ?, ?, ?, ?, ?)", findings)
+            if skip is not None:
+                self._db.execute("insert or replace into skips values (?, ?, ?)", skip)
+            self._set("tests", self.get("tests", 0) + 1)
+
+    def pending(self):
+        return self._db.execute("select count(*) from pending").fetchone()[0]
+
+    def skips(self):
+        return self._db.execute("select reg, bit, reason from skips order by reg, bit").fetchall()
+
+    def findings(self, reg=None, bit=None, peripheral=None):
+        query = "select reg, bit, peripheral, offset, before, after from findings where 1"
+        args = []
+        if reg is not None:
+            query += " and reg = ?"
+            args.append(reg)
+        if bit is not None:
+            query += " and bit = ?"
+            args.append(bit)
+        if peripheral is not None:
+            query += " and peripheral like ?"
+            args.append(f"%{peripheral}%")
+        return self._db.execute(query + " order by reg, bit, peripheral, offset", args).fetchall()
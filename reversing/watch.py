@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""
+Watches RP1 registers or memory and logs every change with a timestamp.
+
+Targets are registers ("WATCHDOG.SCRATCH0"), blocks ("SYSINFO", the part
+below the atomic aliases) or addresses, each optionally followed by :length,
+e.g. 0x200059d8:8 for the boot pointers the firmware keeps in SRAM. Changes
+are logged per word, lengths are rounded up to whole words.
+
+    ./watch.py run -o boot.log --pcie --rate 20000 0x200059d8:8 PCIE_APBS
+    ./watch.py decode boot.log
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rp1 import regmap
+from rp1.snapshot import DEFAULT_SPAN, format_change
+from rp1.watch import MISSED, Watcher, read_log
+
+def target(spec):
+    what, _, length = spec.partition(":")
+    length = int(length, 0) if length else None
+    try:
+        if "." in what:
+            return what, regmap.addr(what), length or 4
+        b = regmap.block(what)
+        return what, b.addr, length or min(b.size, DEFAULT_SPAN)
+    except KeyError:
+        pass
+    try:
+        addr = int(what, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%s is neither a register, a block nor an address" % what)
+    return "%08x" % addr, addr, length or 4
+
+def run(args):
+    if args.pcie:
+        from rp1.pcie import RP1Bars
+        dev = RP1Bars()
+    else:
+        from rp1.bootstrap import Bootstrap
+        dev = Bootstrap()
+
+    interval = 1 / args.rate if args.rate else 0.0
+    with open(args.output, "wb") as f:
+        w = Watcher(dev, args.targets, f)
+        took = w.run(interval, args.duration, args.count)
+    print("%d samples in %.2fs (%.0f/s), %d changes, %d missed" %
+          (w.samples, took, w.samples / took if took else 0, w.changes, w.missed))
+
+def decode(args):
+    started, interval, targets, events = read_log(args.log)
+    print("%d targets, %s, %d events" % (len(targets),
+          "%.0f samples/s" % (1 / interval) if interval else "as fast as possible", len(events)))
+    last = {}
+    for t, addr, val in events:
+        if addr == MISSED:
+            print("%12.6f missed %d samples" % (t / 1e9, val))
+            continue
+        old = last.get(addr)
+        last[addr] = val
+        if old is None:
+            if not args.initial:
+                continue
+            old = val
+        print("%12.6f %s" % (t / 1e9, format_change(addr, old, val)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd")
+
+    p = sub.add_parser("run", help="watch targets")
+    p.add_argument("targets", nargs="+", type=target)
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--pcie", action="store_true", help="read the BARs instead of using the bootstrap interface")
+    p.add_argument("--rate", type=float, default=1000, help="samples per second, 0 for as fast as possible (default: %(default)g)")
+    p.add_argument("--duration", type=float, help="seconds to watch for, until ^C otherwise")
+    p.add_argument("--count", type=int, help="number of samples to take")
+    p.set_defaults(func=run)
+
+    p = sub.add_parser("decode", help="print a log")
+    p.add_argument("log")
+    p.add_argument("--initial", action="store_true", help="also print the values of the first sample")
+    p.set_defaults(func=decode)
+
+    args = parser.parse_args()
+    if args.cmd is None:
+        parser.print_help()
+        return
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Shared host side code for poking at the RP1.
+"""
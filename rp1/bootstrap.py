@@ -0,0 +1,232 @@
+"""
+Host side of the RP1 bootstrap I2C interface.
+
+The bootstrap slave sits at 0x43 on i2c10 once overlay/rp1_bootstrap.dtso is
+loaded. A write is the big endian 32 bit address followed by up to 64 bytes of
+data. A read is the address write followed by a repeated start read.
+
+Every access used to be its own i2c_rdwr ioctl (two for reads). The kernel
+happily takes up to 42 messages per ioctl, so everything here is queued into a
+Batch first and then pushed out in as few ioctls as possible.
+
+The actual bus is behind a transport object, anything with a max_msgs
+attribute and a transfer(msgs) method:
+
+    msgs is a list of bytes (an address write, optionally followed by data) or
+    int (a read of that many bytes from the previously written address).
+    transfer() performs all of them as one combined transaction and returns
+    the data of all reads in order.
+"""
+
+import struct
+import time
+
+BOOTSTRAP_I2C_BUS = 10
+BOOTSTRAP_I2C_ADDR = 0x43
+
+# the bootstrap slave takes at most 64 data bytes per write
+MAX_XFER_LEN = 64
+
+# I2C_RDWR_IOCTL_MAX_MSGS in the kernel
+MAX_MSGS_PER_IOCTL = 42
+
+_pack_addr = struct.Struct(">I").pack
+_reg = struct.Struct("<I")
+
+
+def split_transfers(msgs, max_msgs):
+    """
+    Splits msgs into transfers of at most max_msgs messages, keeping every
+    read in the same transfer as its address write.
+    """
+    # a read is only ever sent along with its address write
+    if max_msgs < 2:
+        raise ValueError("transports need to take at least 2 messages per transfer, not %d" % max_msgs)
+    start = 0
+    while start < len(msgs):
+        end = start + max_msgs
+        if end < len(msgs) and msgs[end].__class__ is int:
+            end -= 1
+        yield msgs[start:end]
+        start = end
+
+
+class SMBusTransport:
+    """
+    i2c-dev transport, every transfer() is a single I2C_RDWR ioctl.
+    """
+    max_msgs = MAX_MSGS_PER_IOCTL
+
+    def __init__(self, bus=BOOTSTRAP_I2C_BUS, addr=BOOTSTRAP_I2C_ADDR):
+        # imported here, so the rest of the module works without smbus2
+        from smbus2 import SMBus, i2c_msg
+        self._bus = SMBus(bus)
+        self._i2c_msg = i2c_msg
+        self._addr = addr
+
+    def transfer(self, msgs):
+        i2c_msgs = []
+        reads = []
+        for m in msgs:
+            if m.__class__ is int:
+                msg = self._i2c_msg.read(self._addr, m)
+                reads.append(msg)
+            else:
+                msg = self._i2c_msg.write(self._addr, m)
+            i2c_msgs.append(msg)
+        self._bus.i2c_rdwr(*i2c_msgs)
+        return [bytes(r) for r in reads]
+
+    def close(self):
+        self._bus.close()
+
+
+class GpiodRunLine:
+    """
+    The RP1_RUN GPIO exposed by the bootstrap overlay. Low holds the RP1 in
+    reset.
+    """
+    def __init__(self, chip="gpiochip2", line="RP1_RUN"):
+        import gpiod
+        self._chip = gpiod.Chip(chip)
+        self._line = self._chip.find_line(line)
+        self._line.request(consumer="RP1_Loader", type=gpiod.LINE_REQ_DIR_OUT, default_vals=[1])
+
+    def set_value(self, val):
+        self._line.set_value(val)
+
+
+class Batch:
+    """
+    A queue of bootstrap accesses that are executed in order by run().
+
+    read() and read_reg() return the index of their result in the list
+    returned by run(). An address write is never split from its read, so
+    every read keeps its repeated start.
+    """
+    def __init__(self, client):
+        self._client = client
+        self._msgs = []
+        self._decode = []
+
+    def __len__(self):
+        return len(self._msgs)
+
+    def write(self, addr, data):
+        msgs = self._msgs
+        if len(data) <= MAX_XFER_LEN:
+            msgs.append(_pack_addr(addr) + data)
+            return
+        data = memoryview(data)
+        for off in range(0, len(data), MAX_XFER_LEN):
+            msgs.append(_pack_addr(addr + off) + data[off:off + MAX_XFER_LEN])
+
+    def write_reg(self, addr, val):
+        self._msgs.append(_pack_addr(addr) + _reg.pack(val))
+
+    def read(self, addr, length):
+        self._msgs.append(_pack_addr(addr))
+        self._msgs.append(length)
+        self._decode.append(None)
+        return len(self._decode) - 1
+
+    def read_reg(self, addr):
+        self._msgs.append(_pack_addr(addr))
+        self._msgs.append(4)
+        self._decode.append(_reg.unpack)
+        return len(self._decode) - 1
+
+    def run(self):
+        msgs, self._msgs = self._msgs, []
+        decode, self._decode = self._decode, []
+        results = self._client._transfer(msgs)
+        for i, d in enumerate(decode):
+            if d is not None:
+                results[i] = d(results[i])[0]
+        return results
+
+
+class Bootstrap:
+    """
+    Client for the bootstrap slave on top of a transport. Without arguments it
+    talks to the real hardware.
+    """
+    def __init__(self, transport=None, run_line=None):
+        if transport is None:
+            transport = SMBusTransport()
+        self.transport = transport
+        self.run_line = run_line
+        # number of transport transfers, i.e. ioctls on real hardware
+        self.transfers = 0
+
+    def _transfer(self, msgs):
+        transfer = self.transport.transfer
+        results = []
+        for part in split_transfers(msgs, self.transport.max_msgs):
+            results += transfer(part)
+            self.transfers += 1
+        return results
+
+    def batch(self):
+        return Batch(self)
+
+    def reset(self, delay=0.1):
+        self.run_line.set_value(0)
+        time.sleep(delay)
+        self.run_line.set_value(1)
+        time.sleep(delay)
+
+    def write_bytes(self, addr, data):
+        b = self.batch()
+        b.write(addr, data)
+        b.run()
+
+    def read_bytes(self, addr, length):
+        b = self.batch()
+        b.read(addr, length)
+        return b.run()[0]
+
+    def write_reg(self, addr, val):
+        self.write_bytes(addr, _reg.pack(val))
+
+    def read_reg(self, addr):
+        b = self.batch()
+        b.read_reg(addr)
+        return b.run()[0]
+
+    def read_regs(self, addrs):
+        b = self.batch()
+        for addr in addrs:
+            b.read_reg(addr)
+        return b.run()
+
+    def write_regs(self, regs):
+        """
+        Writes a list of (addr, val) pairs in order.
+        """
+        b = self.batch()
+        for addr, val in regs:
+            b.write_reg(addr, val)
+        b.run()
+
+    def read_block(self, addr, length, chunk=MAX_XFER_LEN):
+        b = self.batch()
+        for off in range(0, length, chunk):
+            b.read(addr + off, min(chunk, length - off))
+        return b"".join(b.run())
+
+    def read_into(self, addr, buf, chunk=MAX_XFER_LEN, batch_len=64 * 1024):
+        """
+        Fills the preallocated buf from addr, batch_len bytes per batch so
+        big reads don't pile up results.
+        """
+        buf = memoryview(buf).cast("B")
+        for start in range(0, len(buf), batch_len):
+            end = min(start + batch_len, len(buf))
+            b = self.batch()
+            for off in range(start, end, chunk):
+                b.read(addr + off, min(chunk, end - off))
+            off = start
+            for data in b.run():
+                buf[off:off + len(data)] = data
+                off += len(data)
@@ -0,0 +1,131 @@
+"""
+Captures of RP1 memory straight into memory mapped files.
+
+Anything with a read_into(addr, buf) method is a source: rp1.pcie.RP1Bars
+copies out of the BAR mappings, rp1.bootstrap.Bootstrap reads over I2C. The
+output file is created at its full size and mapped, and the source fills the
+mapping chunk by chunk, so a capture never holds more than the page cache.
+
+A Ring keeps the last few captures of a region, for watching it change while
+the firmware runs. prefix.000.bin .. prefix.NNN.bin are the slots, and
+prefix.index records for each slot which capture it holds and when it was
+taken:
+
+    per slot: capture number (from 1, 0 if the slot is unused), time
+"""
+
+import mmap
+import os
+import struct
+import time
+
+# bytes handed to the source at once
+CHUNK = 1024 * 1024
+
+_INDEX = struct.Struct("<Qd")
+
+
+class MappedFile:
+    """
+    A file of length bytes, mapped read/write as .mem.
+    """
+    def __init__(self, path, length):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, length)
+            self._mm = mmap.mmap(fd, length)
+        finally:
+            os.close(fd)
+        self.length = length
+        self.mem = memoryview(self._mm)
+
+    def close(self):
+        self.mem.release()
+        self._mm.close()
+
+
+def fill(dev, addr, mem, chunk=CHUNK):
+    for off in range(0, len(mem), chunk):
+        dev.read_into(addr + off, mem[off:off + chunk])
+
+
+def capture(dev, addr, length, path, chunk=CHUNK):
+    """
+    Captures length bytes from addr into the file at path.
+    """
+    out = MappedFile(path, length)
+    try:
+        fill(dev, addr, out.mem, chunk)
+    finally:
+        out.close()
+
+
+class Ring:
+    def __init__(self, prefix, length, slots):
+        self.prefix = prefix
+        self.slots = [MappedFile("%s.%03d.bin" % (prefix, i), length) for i in range(slots)]
+        self.index = MappedFile(prefix + ".index", slots * _INDEX.size)
+        self.index.mem[:] = bytes(len(self.index.mem))
+        self.count = 0
+
+    def capture(self, dev, addr, chunk=CHUNK):
+        """
+        Captures into the oldest slot, returns the slot.
+        """
+        slot = self.count % len(self.slots)
+        t = time.time()
+        # the slot is unlabelled while it is overwritten, so a capture that
+        # gets interrupted doesn't pass for the previous one
+        _INDEX.pack_into(self.index.mem, slot * _INDEX.size, 0, 0.0)
+        fill(dev, addr, self.slots[slot].mem, chunk)
+        self.count += 1
+        _INDEX.pack_into(self.index.mem, slot * _INDEX.size, self.count, t)
+        return slot
+
+    def close(self):
+        for f in self.slots:
+            f.close()
+        self.index.close()
+
+
+def read_index(prefix):
+    """
+    Returns (capture number, time, slot file) of the captures in a ring,
+    oldest first.
+    """
+    with open(prefix + ".index", "rb") as f:
+        raw = f.read()
+    entries = []
+    for slot in range(len(raw) // _INDEX.size):
+        n, t = _INDEX.unpack_from(raw, slot * _INDEX.size)
+        if n:
+            entries.append((n, t, "%s.%03d.bin" % (prefix, slot)))
+    entries.sort()
+    return entries
+
+
+def capture_ring(dev, addr, length, prefix, slots, interval, count=None, chunk=CHUNK):
+    """
+    Captures every interval seconds into a Ring until count captures are
+    done or it's interrupted. Captures that start more than an interval
+    late are counted, returns (captures, late).
+    """
+    ring = Ring(prefix, length, slots)
+    late = 0
+    try:
+        deadline = time.monotonic()
+        while count is None or ring.count < count:
+            now = time.monotonic()
+            if now < deadline:
+                time.sleep(deadline - now)
+            elif now - deadline > interval:
+                late += 1
+                # don't try to catch up
+                deadline = now
+            ring.capture(dev, addr, chunk)
+            deadline += interval
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+    return ring.count, late
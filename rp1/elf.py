@@ -0,0 +1,100 @@
+"""
+Just enough ELF parsing for firmware images: sections, program headers and
+symbols of 32 and 64 bit files of either endianness. Works on anything with
+the buffer protocol without copying it.
+"""
+
+import collections
+import struct
+
+PT_LOAD = 1
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+
+SHF_WRITE = 1
+SHF_ALLOC = 2
+
+STT_OBJECT = 1
+STT_FUNC = 2
+
+Section = collections.namedtuple("Section", "name type flags addr offset size")
+Segment = collections.namedtuple("Segment", "type flags offset vaddr paddr filesz memsz")
+Symbol = collections.namedtuple("Symbol", "name value size type shndx")
+
+
+class ELF:
+    def __init__(self, data):
+        self.data = memoryview(data).cast("B")
+        if bytes(self.data[:4]) != b"\x7fELF":
+            raise ValueError("not an ELF file")
+        self.is64 = self.data[4] == 2
+        self._e = "<" if self.data[5] == 1 else ">"
+        e = self._e
+
+        if self.is64:
+            (self.type, self.machine, _, self.entry, phoff, shoff, self.flags, _,
+             phentsize, phnum, shentsize, shnum, shstrndx) = struct.unpack_from(e + "HHIQQQIHHHHHH", self.data, 16)
+        else:
+            (self.type, self.machine, _, self.entry, phoff, shoff, self.flags, _,
+             phentsize, phnum, shentsize, shnum, shstrndx) = struct.unpack_from(e + "HHIIIIIHHHHHH", self.data, 16)
+
+        self.segments = []
+        for i in range(phnum):
+            off = phoff + i * phentsize
+            if self.is64:
+                p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, _ = \
+                    struct.unpack_from(e + "IIQQQQQQ", self.data, off)
+            else:
+                p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags, _ = \
+                    struct.unpack_from(e + "IIIIIIII", self.data, off)
+            self.segments.append(Segment(p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz))
+
+        raw = []
+        for i in range(shnum):
+            off = shoff + i * shentsize
+            if self.is64:
+                raw.append(struct.unpack_from(e + "IIQQQQIIQQ", self.data, off))
+            else:
+                raw.append(struct.unpack_from(e + "IIIIIIIIII", self.data, off))
+        self._raw_sections = raw
+
+        strtab = raw[shstrndx] if shnum and shstrndx < shnum else None
+        self.sections = []
+        for name, sh_type, flags, addr, offset, size, link, info, align, entsize in raw:
+            if strtab is not None:
+                name = self._string(strtab[4], name)
+            self.sections.append(Section(name, sh_type, flags, addr, offset, size))
+
+    def _string(self, offset, idx):
+        start = offset + idx
+        end = start
+        while self.data[end] != 0:
+            end += 1
+        return bytes(self.data[start:end]).decode("utf-8", "replace")
+
+    def section(self, name):
+        for s in self.sections:
+            if s.name == name:
+                return s
+        return None
+
+    def section_data(self, s):
+        if s.type == SHT_NOBITS:
+            return memoryview(bytes(s.size))
+        return self.data[s.offset:s.offset + s.size]
+
+    def symbols(self):
+        syms = []
+        for raw in self._raw_sections:
+            if raw[1] != SHT_SYMTAB:
+                continue
+            offset, size, link, entsize = raw[4], raw[5], raw[6], raw[9]
+            strtab = self._raw_sections[link][4]
+            for off in range(offset, offset + size, entsize):
+                if self.is64:
+                    name, info, _, shndx, value, sz = struct.unpack_from(self._e + "IBBHQQ", self.data, off)
+                else:
+                    name, value, sz, info, _, shndx = struct.unpack_from(self._e + "IIIBBH", self.data, off)
+                syms.append(Symbol(self._string(strtab, name), value, sz, info & 0xf, shndx))
+        return syms
@@ -0,0 +1,205 @@
+"""
+Runs RP1 firmware on the host, on a Cortex-M3 emulated by unicorn.
+
+unicorn translates the code into host code a block at a time and keeps the
+translations, so straight code runs at tens of millions of instructions per
+second. Only the peripheral window calls back into Python: every access to
+0x40000000 - 0x407fffff goes to the model registered for its block, or to a
+rp1.sim.SimRP1 for the rest, and is appended to Emulator.log.
+
+A model is anything with
+
+    read(offset, size) -> value
+    write(offset, size, value)
+
+offset being relative to the base it was added at, atomic alias bits
+included.
+
+The memory map is the MEMORY part of a payload linker script, or the one
+all of them use:
+
+    emu = Emulator(layout("payload/blinky/linker.ld"))
+    emu.load(0x20000000, open("payload/blinky/blinky.bin", "rb").read())
+    emu.boot(0x20000001, 0x100030d0)
+    emu.run(count=1000000)
+
+unicorn is only needed when an Emulator is created.
+"""
+
+import collections
+import re
+
+from . import regmap
+from .sim import SimRP1
+from .upload import DEFAULT_ENTRY, DEFAULT_SP
+
+# the core ID register blinky and second_core check
+CORE_ID_ADDR = 0xe00ff01c
+
+Region = collections.namedtuple("Region", "name origin length perms")
+Access = collections.namedtuple("Access", "pc addr size value write")
+
+# as in payload/*/linker.ld
+DEFAULT_LAYOUT = [
+    Region("RAM", regmap.SRAM_BASE, regmap.SRAM_SIZE, "rwx"),
+    Region("IRAM", regmap.LOCAL_RAM_BASE, regmap.LOCAL_RAM_SIZE // 2, "rwx"),
+    Region("DRAM", regmap.LOCAL_RAM_BASE + regmap.LOCAL_RAM_SIZE // 2, regmap.LOCAL_RAM_SIZE // 2, "rw"),
+]
+
+_MEMORY_RE = re.compile(r"MEMORY\s*\{(.*?)\}", re.S)
+_REGION_RE = re.compile(r"(\w+)\s*\(\s*(\w+)\s*\)\s*:\s*ORIGIN\s*=\s*(\w+)\s*,\s*LENGTH\s*=\s*(\w+)")
+_UNITS = {"K": 1024, "M": 1024 * 1024}
+
+def _size(s):
+    if s[-1].upper() in _UNITS:
+        return int(s[:-1], 0) * _UNITS[s[-1].upper()]
+    return int(s, 0)
+
+def layout(path):
+    """
+    The regions of the MEMORY command in a linker script.
+    """
+    with open(path) as f:
+        m = _MEMORY_RE.search(f.read())
+    if m is None:
+        raise ValueError("%s: no MEMORY command" % path)
+    return [Region(name, _size(origin), _size(length), perms.lower())
+            for name, perms, origin, length in _REGION_RE.findall(m.group(1))]
+
+
+class Emulator:
+    """
+    rom is the boot ROM content, mapped at 0 (zeros without it). sim handles
+    the peripherals nothing else was added for, a fresh SimRP1 by default.
+    core is what the core ID register reads.
+    """
+    def __init__(self, regions=None, rom=None, sim=None, core=0):
+        # imported here, so the rest of rp1 works without unicorn
+        import unicorn
+        from unicorn import arm_const
+        self._uc_mod = unicorn
+        self._arm = arm_const
+
+        uc = unicorn.Uc(unicorn.UC_ARCH_ARM, unicorn.UC_MODE_THUMB | unicorn.UC_MODE_MCLASS)
+        uc.ctl_set_cpu_model(arm_const.UC_CPU_ARM_CORTEX_M3)
+        self.uc = uc
+
+        self.regions = DEFAULT_LAYOUT if regions is None else regions
+        for r in self.regions:
+            perms = 0
+            if "r" in r.perms:
+                perms |= unicorn.UC_PROT_READ
+            if "w" in r.perms:
+                perms |= unicorn.UC_PROT_WRITE
+            if "x" in r.perms:
+                perms |= unicorn.UC_PROT_EXEC
+            uc.mem_map(r.origin, r.length, perms)
+
+        uc.mem_map(regmap.ROM_BASE, regmap.ROM_WINDOW, unicorn.UC_PROT_READ | unicorn.UC_PROT_EXEC)
+        if rom is not None:
+            # the 32K are mirrored once
+            uc.mem_write(regmap.ROM_BASE, bytes(rom[:regmap.ROM_SIZE]) * 2)
+
+        self.sim = SimRP1() if sim is None else sim
+        self.core = core
+        # block base -> (model, base it was added at)
+        self._models = {}
+        self.log = []
+        self.logging = True
+        self.entry = None
+
+        uc.mmio_map(regmap.PERIPH_BASE, regmap.PERIPH_SIZE, self._read, None, self._write, None)
+        uc.mmio_map(CORE_ID_ADDR & ~0xfff, 0x1000, self._read_ppb, None, None, None)
+
+    def add_model(self, base, model, size=regmap.BLOCK_SIZE):
+        """
+        Routes base..base+size to model, base being an address or a block
+        name.
+        """
+        if isinstance(base, str):
+            base = regmap.block(base).addr
+        for block in range(base & regmap.BLOCK_MASK, base + size, regmap.BLOCK_SIZE):
+            self._models[block] = (model, base)
+
+    def load(self, addr, data):
+        self.uc.mem_write(addr, bytes(data))
+
+    def read(self, addr, length):
+        return bytes(self.uc.mem_read(addr, length))
+
+    def boot(self, entry=DEFAULT_ENTRY, sp=DEFAULT_SP):
+        self.entry = entry
+        self.uc.reg_write(self._arm.UC_ARM_REG_SP, sp)
+
+    def boot_from(self, sim):
+        """
+        Continues where a SimRP1 left off: its SRAM and local RAM, its
+        peripherals and the entry and SP of its last watchdog boot handoff.
+        """
+        if not sim.boots:
+            raise ValueError("the simulated RP1 was never booted through the watchdog")
+        self.sim = sim
+        self.load(regmap.SRAM_BASE, sim.sram)
+        self.load(regmap.LOCAL_RAM_BASE, sim.local_ram)
+        self.boot(*sim.boots[-1])
+
+    @property
+    def pc(self):
+        return self.uc.reg_read(self._arm.UC_ARM_REG_PC)
+
+    def reg(self, name):
+        return self.uc.reg_read(getattr(self._arm, "UC_ARM_REG_" + name.upper()))
+
+    def run(self, count=0, until=0, timeout=0):
+        """
+        Runs count instructions (0 for no limit), until the PC reaches until
+        or for timeout seconds, whatever comes first. Continues where the
+        last run stopped.
+        """
+        start = self.pc if self.entry is None else self.entry
+        self.entry = None
+        self.uc.emu_start(start | 1, until, int(timeout * 1000000), count)
+
+    def stop(self):
+        """
+        Stops run(), e.g. from a model.
+        """
+        self.uc.emu_stop()
+
+    # MMIO
+
+    def _read(self, uc, off, size, user):
+        addr = regmap.PERIPH_BASE + off
+        m = self._models.get(addr & regmap.BLOCK_MASK)
+        if m is not None:
+            val = m[0].read(addr - m[1], size)
+        else:
+            val = self.sim.read32(addr & ~3) >> ((addr & 3) * 8)
+            val &= (1 << (size * 8)) - 1
+        if self.logging:
+            self.log.append(Access(uc.reg_read(self._arm.UC_ARM_REG_PC), addr, size, val, False))
+        return val
+
+    def _write(self, uc, off, size, val, user):
+        addr = regmap.PERIPH_BASE + off
+        if self.logging:
+            self.log.append(Access(uc.reg_read(self._arm.UC_ARM_REG_PC), addr, size, val, True))
+        m = self._models.get(addr & regmap.BLOCK_MASK)
+        if m is not None:
+            m[0].write(addr - m[1], size, val)
+        elif size == 4:
+            self.sim.write32(addr, val)
+        else:
+            # the bus repeats narrow writes across the word, like on the RP2040
+            val &= (1 << (size * 8)) - 1
+            self.sim.write32(addr & ~3, val * (0x01010101 if size == 1 else 0x00010001))
+
+    def _read_ppb(self, uc, off, size, user):
+        if (CORE_ID_ADDR & 0xfff) == off:
+            return self.core
+        return 0
+
+
+def format_access(a):
+    return "%08x %s %08x %-28s %0*x" % (a.pc, "w" if a.write else "r", a.addr,
+                                        regmap.decode(a.addr), a.size * 2, a.value)
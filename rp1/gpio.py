@@ -0,0 +1,101 @@
+"""
+GPIO output over the PCIe BAR through SYS_RIO.
+
+Every RP1 peripheral block has atomic aliases of its registers, at +0x1000
+(XOR), +0x2000 (SET) and +0x3000 (CLR), the same scheme the resets block uses
+at 0x16000/0x17000. Going through them means a pin change is a single posted
+write instead of a read over PCIe followed by a write, and other users of the
+bank don't get their bits clobbered.
+
+play() pushes a precomputed buffer of words into one register. The loop runs
+in C (map() over the buffer, drained by a zero length deque), so the cost per
+edge is one store through the memoryview.
+"""
+
+import collections
+import itertools
+import time
+from array import array
+
+from .regmap import ALIAS_CLR, ALIAS_SET, ALIAS_XOR, BLOCK_SIZE, block
+
+# BAR1 offsets
+RP1_IO_BANK0_BASE = block("IO_BANK0").base
+RP1_SYS_RIO0_BASE = block("SYS_RIO0").base
+RP1_PADS_BANK0_BASE = block("PADS_BANK0").base
+
+BANK_STRIDE = BLOCK_SIZE
+
+#SYS_RIO offsets
+SYS_RIO_OUT_OFF = block("SYS_RIO0").regs["OUT"].offset
+SYS_RIO_OE_OFF = block("SYS_RIO0").regs["OE"].offset
+SYS_RIO_IN_OFF = block("SYS_RIO0").regs["IN"].offset
+
+# func: SYS_RIO, output and output enable from peripheral
+GPIO_CTRL_SYS_RIO = 0x85
+PAD_DEFAULT_OUTPUT = 0x56
+
+
+class SysRIO:
+    """
+    One SYS_RIO bank on top of rp1.pcie.RP1Bars.
+    """
+    def __init__(self, bars, bank=0):
+        self._bars = bars
+        self._words = bars.periph.words
+        self.bank = bank
+        base = (RP1_SYS_RIO0_BASE + bank * BANK_STRIDE) >> 2
+        self._out = base + (SYS_RIO_OUT_OFF >> 2)
+        self._oe = base + (SYS_RIO_OE_OFF >> 2)
+        self._in = base + (SYS_RIO_IN_OFF >> 2)
+
+    def setup_output(self, pin, pad=PAD_DEFAULT_OUTPUT):
+        """
+        Hands pin over to SYS_RIO and enables its output driver.
+        """
+        io = RP1_IO_BANK0_BASE + self.bank * BANK_STRIDE
+        pads = RP1_PADS_BANK0_BASE + self.bank * BANK_STRIDE
+        self._bars.reg_write(io, pin * 8 + 4, GPIO_CTRL_SYS_RIO)
+        self._bars.reg_write(pads, pin * 4 + 4, pad)
+        self._words[self._oe + (ALIAS_SET >> 2)] = 1 << pin
+
+    def set(self, mask):
+        self._words[self._out + (ALIAS_SET >> 2)] = mask
+
+    def clear(self, mask):
+        self._words[self._out + (ALIAS_CLR >> 2)] = mask
+
+    def toggle(self, mask):
+        self._words[self._out + (ALIAS_XOR >> 2)] = mask
+
+    def write(self, val):
+        self._words[self._out] = val
+
+    def read(self):
+        return self._words[self._in]
+
+    def play(self, waveform, repeat=1, alias=None):
+        """
+        Writes every word of waveform to OUT, or to one of its aliases, e.g.
+        ALIAS_XOR for a buffer of toggle masks. waveform is best an
+        array('I'). Returns the achieved rate in writes per second.
+        """
+        reg = self._out + ((alias or 0) >> 2)
+        store = self._words.__setitem__
+        if not isinstance(waveform, array):
+            waveform = array("I", waveform)
+        n = len(waveform) * repeat
+        seq = itertools.chain.from_iterable(itertools.repeat(waveform, repeat))
+
+        start = time.perf_counter()
+        collections.deque(map(store, itertools.repeat(reg, n), seq), maxlen=0)
+        elapsed = time.perf_counter() - start
+        return n / elapsed if elapsed else 0.0
+
+
+def square_wave(mask, edges):
+    """
+    Toggle masks for play(..., alias=ALIAS_XOR) that flip the pins in mask
+    edges times.
+    """
+    return array("I", [mask]) * edges
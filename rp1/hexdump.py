@@ -0,0 +1,116 @@
+"""
+hexdump -C style dumps that are fast enough for whole BARs.
+
+The hex and ASCII columns are made for a big chunk of the input at once with
+bytes.hex() and a translation table, lines are only sliced out of that.
+Repeated lines are collapsed into a "*" like hexdump does.
+"""
+
+from . import regmap
+
+LINE = 16
+# lines formatted at once
+CHUNK_LINES = 4096
+
+# non printable bytes show up as "."
+_ASCII = bytes(x if 32 <= x < 127 else ord(".") for x in range(256))
+
+
+def registers(addr, length=LINE):
+    """
+    Annotation with the names of the known registers in addr..addr+length.
+    """
+    names = []
+    for a in range(addr & ~3, addr + length, 4):
+        loc = regmap.lookup(a)
+        if loc is not None and loc.reg is not None:
+            names.append(regmap.decode(a))
+    return " ".join(names)
+
+
+def _partial(off, bs):
+    return "{:08x}  {:23}  {:23}  |{:16}|".format(
+        off, bs[:8].hex(" "), bs[8:].hex(" "), bs.translate(_ASCII).decode("ascii"))
+
+
+class hexdump:
+    """
+    Iterating gives the lines, str() all of them. buf is anything with the
+    buffer protocol or a file opened in binary mode, which is read as it
+    goes. annotate is called with the address and length of every line and
+    what it returns is appended, registers() names the registers.
+    """
+    def __init__(self, buf, off=0, annotate=None):
+        self.buf = buf
+        self.off = off
+        self.annotate = annotate
+
+    def _chunks(self):
+        size = LINE * CHUNK_LINES
+        if hasattr(self.buf, "read"):
+            while True:
+                data = self.buf.read(size)
+                if not data:
+                    return
+                yield data
+        else:
+            mem = memoryview(self.buf).cast("B")
+            for i in range(0, len(mem), size):
+                yield mem[i:i + size]
+
+    def __iter__(self):
+        annotate = self.annotate
+        last = None
+        skipping = False
+        pos = self.off
+        rest = b""
+        for chunk in self._chunks():
+            # files may come in pieces that aren't whole lines
+            chunk = rest + bytes(chunk)
+            n = len(chunk)
+            full = n - n % LINE
+            rest = chunk[full:]
+            # 3 chars per byte in hex, the 8th separator is widened to two
+            hexes = chunk[:full].hex(" ")
+            text = chunk[:full].translate(_ASCII).decode("ascii")
+            for i in range(0, full, LINE):
+                bs = chunk[i:i + LINE]
+                note = annotate(pos + i, LINE) if annotate else ""
+                if bs == last and not note:
+                    if not skipping:
+                        yield "*"
+                        skipping = True
+                    continue
+                last = bs
+                skipping = False
+                h = hexes[i * 3:i * 3 + 47]
+                line = "%08x  %s  %s  |%s|" % (pos + i, h[:23], h[24:], text[i:i + LINE])
+                yield line + "  " + note if note else line
+            pos += full
+        if rest:
+            note = annotate(pos, len(rest)) if annotate else ""
+            line = _partial(pos, rest)
+            yield line + "  " + note if note else line
+            pos += len(rest)
+        yield "{:08x}".format(pos)
+
+    def write(self, f):
+        """
+        Writes the dump to a text file a chunk at a time, without building
+        all of it in memory.
+        """
+        lines = []
+        for line in self:
+            lines.append(line)
+            if len(lines) == CHUNK_LINES:
+                lines.append("")
+                f.write("\n".join(lines))
+                lines = []
+        lines.append("")
+        f.write("\n".join(lines))
+
+    def __str__(self):
+        return "\n".join(self)
+
+    def __repr__(self):
+        return "\n".join(self)
@@ -0,0 +1,112 @@
+"""
+Access to the RP1 over its PCIe BARs, as exposed by the original firmware.
+
+BAR1 maps the peripherals at 0x40000000, BAR2 the SRAM at 0x20000000. Both are
+mapped from /dev/mem through a single file descriptor. Registers are accessed
+through a uint32 memoryview of the mapping, so a register access doesn't
+allocate buffers or move a file position.
+
+Any file can stand in for /dev/mem, e.g. a sparse temp file:
+
+    f = tempfile.NamedTemporaryFile()
+    f.truncate(RP1_BAR2 - RP1_BAR1 + RP1_BAR2_LEN)
+    bars = RP1Bars(f.name, bar1=0, bar2=RP1_BAR2 - RP1_BAR1)
+"""
+
+import mmap
+import os
+
+from .regmap import PERIPH_BASE, SRAM_BASE
+
+RP1_BAR1 = 0x1f00000000
+RP1_BAR1_LEN = 0x400000
+
+RP1_BAR2 = 0x1f00400000
+RP1_BAR2_LEN = 64*1024
+
+
+class MMIORegion:
+    """
+    A mapped window. Offsets are relative to the start of the window and
+    register accesses have to be 4 byte aligned.
+    """
+    def __init__(self, fd, offset, length):
+        self._mm = mmap.mmap(fd, length, offset=offset)
+        self.length = length
+        self.mem = memoryview(self._mm)
+        self.words = self.mem.cast("I")
+
+    def read32(self, off):
+        return self.words[off >> 2]
+
+    def write32(self, off, val):
+        self.words[off >> 2] = val
+
+    def read_into(self, off, buf):
+        """
+        Fills the preallocated buf (anything writable with the buffer
+        protocol) from off.
+        """
+        buf = memoryview(buf).cast("B")
+        buf[:] = self.mem[off:off + len(buf)]
+
+    def read_block(self, off, length):
+        return bytes(self.mem[off:off + length])
+
+    def write_block(self, off, data):
+        self.mem[off:off + len(data)] = data
+
+    def close(self):
+        self.words.release()
+        self.mem.release()
+        self._mm.close()
+
+
+class RP1Bars:
+    """
+    BAR1 as periph and BAR2 as sram. reg_read() and reg_write() take a block
+    base and a register offset like the constants in pcie/hacks.py.
+    """
+    def __init__(self, path="/dev/mem", bar1=RP1_BAR1, bar2=RP1_BAR2,
+                 bar1_len=RP1_BAR1_LEN, bar2_len=RP1_BAR2_LEN):
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self.periph = MMIORegion(fd, bar1, bar1_len)
+            self.sram = MMIORegion(fd, bar2, bar2_len)
+        finally:
+            # the mappings stay valid without the fd
+            os.close(fd)
+
+        self._words = self.periph.words
+
+    def reg_read(self, dev, reg):
+        return self._words[(dev + reg) >> 2]
+
+    def reg_write(self, dev, reg, val):
+        self._words[(dev + reg) >> 2] = val
+
+    # the same as Bootstrap.read_reg() and write_reg(), addresses as the RP1
+    # sees them, e.g. from rp1.regmap.addr()
+
+    def read_reg(self, addr):
+        return self._words[(addr - PERIPH_BASE) >> 2]
+
+    def write_reg(self, addr, val):
+        self._words[(addr - PERIPH_BASE) >> 2] = val
+
+    def read_into(self, addr, buf):
+        """
+        Fills buf from RP1 address addr, in BAR1 or BAR2.
+        """
+        if addr >= PERIPH_BASE:
+            bar, off = self.periph, addr - PERIPH_BASE
+        else:
+            bar, off = self.sram, addr - SRAM_BASE
+        if off < 0 or off + memoryview(buf).nbytes > bar.length:
+            raise ValueError("%08x+%x isn't mapped by the BARs" % (addr, memoryview(buf).nbytes))
+        bar.read_into(off, buf)
+
+    def close(self):
+        self._words = None
+        self.periph.close()
+        self.sram.close()
@@ -0,0 +1,407 @@
+"""
+What is known about the RP1 address map, in one place.
+
+Peripheral blocks with their ID tags and reset bits, the few registers and
+fields we have names for, and the memories. Addresses are the ones the RP1
+itself and the bootstrap I2C interface use, PCIe BAR1 offsets are the same
+minus PERIPH_BASE.
+
+lookup() and decode() turn an address back into a block and register through
+a sorted interval index, so decoding a dump or a trace is a bisect and a
+dict lookup per address:
+
+    >>> decode(0x40017004)
+    'RESETS.RESET1:clr'
+    >>> addr("WATCHDOG.SCRATCH0")
+    1075134476
+
+Only reset bits somebody has seen doing something are in here, the blocks
+without one are unknown.
+"""
+
+import bisect
+import collections
+
+ROM_BASE = 0x00000000
+ROM_SIZE = 32 * 1024
+ROM_WINDOW = 64 * 1024      # the 32K are mirrored once
+
+LOCAL_RAM_BASE = 0x10000000     # IRAM at 0x10000000, DRAM at 0x10002000
+LOCAL_RAM_SIZE = 16 * 1024
+
+SRAM_BASE = 0x20000000
+SRAM_SIZE = 128 * 1024
+
+PERIPH_BASE = 0x40000000
+PERIPH_SIZE = 0x800000
+
+BLOCK_SIZE = 0x4000
+BLOCK_MASK = 0xffffc000
+
+# atomic register aliases, offset within a peripheral block
+ALIAS_XOR = 0x1000
+ALIAS_SET = 0x2000
+ALIAS_CLR = 0x3000
+ALIAS_MASK = 0x3000
+ALIAS_NAMES = {0: "", ALIAS_XOR: "xor", ALIAS_SET: "set", ALIAS_CLR: "clr"}
+
+CHIP_ID = 0x20001927
+
+WATCHDOG_BOOT_MAGIC = 0xb007c0de
+
+# name, offset from PERIPH_BASE, tag offset, tag, (reset reg, bit)
+_PERIPHERALS = [
+    ("SYSINFO", 0x000000, 0xa4, b'isys', (1, 23)),
+    ("TBMAN", 0x004000, None, None, None),
+    ("SYSCFG", 0x008000, 0x3c, b'GFCS', (1, 22)),
+    ("OTP", 0x00c000, 0x4c, b'PTOT', None),
+    ("POWER", 0x010000, 0x14, b'rwop', None),
+    ("RESETS", 0x014000, 0x28, b'stsr', None),
+    ("CLOCKS_BANK_DEFAULT", 0x018000, None, None, None),
+    ("CLOCKS_BANK_VIDEO", 0x01c000, 0x64, b'vklc', None),
+    ("PLL_SYS", 0x020000, 0x34, b'LLP\x00', (0, 29)),
+    ("PLL_AUDIO", 0x024000, 0x34, b'LLP\x00', (0, 28)),
+    ("PLL_VIDEO", 0x028000, 0x34, b'LLP\x00', (0, 30)),
+    ("UART0", 0x030000, None, None, (1, 26)),
+    ("UART1", 0x034000, None, None, (1, 27)),
+    ("UART2", 0x038000, None, None, (1, 28)),
+    ("UART3", 0x03c000, None, None, (1, 29)),
+    ("UART4", 0x040000, None, None, (1, 30)),
+    ("UART5", 0x044000, None, None, (1, 31)),
+    ("SPI8", 0x04c000, None, None, (1, 18)),
+    ("SPI0", 0x050000, None, None, (1, 10)),
+    ("SPI1", 0x054000, None, None, (1, 11)),
+    ("SPI2", 0x058000, None, None, (1, 12)),
+    ("SPI3", 0x05c000, None, None, (1, 13)),
+    ("SPI4", 0x060000, None, None, (1, 14)),
+    ("SPI5", 0x064000, None, None, (1, 15)),
+    ("SPI6", 0x068000, None, None, (1, 16)),
+    ("SPI7", 0x06c000, None, None, (1, 17)),
+    ("I2C0", 0x070000, None, None, (0, 7)),
+    ("I2C1", 0x074000, None, None, (0, 8)),
+    ("I2C2", 0x078000, None, None, (0, 9)),
+    ("I2C3", 0x07c000, None, None, (0, 10)),
+    ("I2C4", 0x080000, None, None, (0, 11)),
+    ("I2C5", 0x084000, None, None, (0, 12)),
+    ("I2C6", 0x088000, None, None, (0, 13)),
+    ("AUDIO_IN", 0x090000, 0x34, b'\xa1dua', (0, 1)),
+    ("AUDIO_OUT", 0x094000, 0x4C, b'ODUA', (0, 2)),
+    ("PWM0", 0x098000, 0x64, b'AMWP', (1, 4)),
+    ("PWM1", 0x09c000, 0x64, b'AMWP', (1, 5)),
+    ("I2S0", 0x0a0000, None, None, (0, 14)),
+    ("I2S1", 0x0a4000, None, None, (0, 15)),
+    ("I2S2", 0x0a8000, None, None, (0, 16)),
+    ("TIMER", 0x0ac000, 0x44, b'RMIT', (1, 25)),
+    ("SDIO0_APBS", 0x0b0000, 0x34, b'OIDS', (1, 8)),
+    ("SDIO1_APBS", 0x0b4000, 0x34, b'OIDS', (1, 9)),
+    ("BUSFABRIC_MONITOR", 0x0c0000, None, None, None),
+    ("BUSFABRIC_AXISHIM", 0x0c4000, None, None, None),
+    ("ADC", 0x0c8000, None, None, None),
+    ("IO_BANK0", 0x0d0000, None, None, (0, 17)),
+    ("IO_BANK1", 0x0d4000, None, None, (0, 18)),
+    ("IO_BANK2", 0x0d8000, None, None, (0, 19)),
+    ("UNKNOWN_HOLE", 0x0dc000, None, None, None),
+    ("SYS_RIO0", 0x0e0000, 0x10, b'POIR', (1, 19)),
+    ("SYS_RIO1", 0x0e4000, 0x10, b'POIR', (1, 20)),
+    # PROC_RIO isn't documented anywhere, it might live in here next to SYS_RIO2
+    ("SYS_RIO2", 0x0e8000, 0x10, b'POIR', (1, 21)),
+    ("PADS_BANK0", 0x0f0000, 0x84, b'0dap', (0, 22)),
+    ("PADS_BANK1", 0x0f4000, 0x1C, b'1dap', (0, 23)),
+    ("PADS_BANK2", 0x0f8000, 0x54, b'2dap', (0, 24)),
+    ("PADS_ETH", 0x0fc000, 0x40, b'edap', (0, 25)),
+    ("ETH_IP", 0x100000, None, None, (0, 5)),
+    ("ETH_CFG", 0x104000, 0x2C, b'HTEC', None),
+    ("PCIE_APBS", 0x108000, 0x1B8, b'EICP', (0, 26)),
+    ("MIPI0_CSIDMA", 0x110000, None, None, None),
+    ("MIPI0_CSIHOST", 0x114000, None, None, (0, 20)),
+    ("MIPI0_DSIDMA", 0x118000, None, None, (0, 20)),
+    ("MIPI0_DSIHOST", 0x11c000, None, None, (0, 20)),
+    ("MIPI0_MIPICFG", 0x120000, 0x38, b'IPIM', None),
+    ("MIPI0_ISP", 0x124000, None, None, (0, 20)),
+    ("MIPI1_CSIDMA", 0x128000, None, None, None),
+    ("MIPI1_CSIHOST", 0x12c000, None, None, (0, 21)),
+    ("MIPI1_DSIDMA", 0x130000, None, None, (0, 21)),
+    ("MIPI1_DSIHOST", 0x134000, None, None, (0, 21)),
+    ("MIPI1_MIPICFG", 0x138000, 0x38, b'IPIM', None),
+    ("MIPI1_ISP", 0x13c000, None, None, (0, 21)),
+    ("VIDEO_OUT_CFG", 0x140000, 0x24, b'FCOV', None),
+    ("VIDEO_OUT_VEC", 0x144000, None, None, None),
+    ("VIDEO_OUT_DPI", 0x148000, None, None, (2, 3)),
+    ("XOSC", 0x150000, 0x24, b'CSOX', None),
+    ("WATCHDOG", 0x154000, 0x2C, b'GODW', None),
+    ("DMA_TICK", 0x158000, 0x10, b'TAMD', (0, 4)),
+    ("SDIO_CLOCKS", 0x15c000, None, None, None),
+    ("USBHOST0_APBS", 0x160000, 0xA4, b'BSUS', (2, 0)),
+    ("USBHOST1_APBS", 0x164000, 0xA4, b'BSUS', (2, 1)),
+    ("ROSC0", 0x168000, 0x18, b'CSOR', (1, 6)),
+    ("ROSC1", 0x16c000, 0x18, b'CSOR', (1, 7)),
+    ("VBUSCTRL", 0x170000, 0x18, b'SUBV', (2, 2)),
+    ("TICKS", 0x174000, 0x60, b'kcit', None),
+    ("PIO_APBS", 0x178000, 0x20, b'3oip', (0, 27)),
+    ("SDIO0_AHBLS", 0x180000, None, None, (1, 8)),
+    ("SDIO1_AHBLS", 0x184000, None, None, (1, 9)),
+    ("DMA", 0x188000, None, None, None),
+    ("RAM", 0x1c0000, None, None, None),
+    ("USBHOST0_AXIS", 0x200000, None, None, None),
+    ("USBHOST1_AXIS", 0x300000, None, None, None),
+    ("EXAC", 0x400000, None, None, (0, 6)),     # reads fail after this reset
+]
+
+# blocks that aren't BLOCK_SIZE long
+_SIZES = {
+    "RAM": 0x20000,
+    "USBHOST0_AXIS": 0x100000,
+    "USBHOST1_AXIS": 0x100000,
+}
+
+# reset bits that don't belong to a block
+OTHER_RESETS = {
+    "PROC1": (0, 31),       # might also be another PLL
+}
+
+_WEIRD = "reading it makes the bootstrap interface return weird data afterwards"
+
+# blocks that are left alone when probing around, and why
+DONT_PROBE = {
+    "RESETS": "that is what is being poked",
+    "TIMER": "ticking",
+    "ADC": _WEIRD,
+    "MIPI0_ISP": _WEIRD,
+    "MIPI1_ISP": _WEIRD,
+    "DMA_TICK": _WEIRD,
+    "TICKS": "ticking",
+    "DMA": _WEIRD,
+    "RAM": "memory",
+    "USBHOST0_AXIS": _WEIRD,
+    "USBHOST1_AXIS": _WEIRD,
+}
+
+# asserting these takes down the bootstrap I2C interface until the next reset
+BOOTSTRAP_BUS_RESETS = [
+    (0, 12),    # I2C5, the bootstrap I2C interface
+    (0, 18),    # IO_BANK1, has the bootstrap I2C pins
+    (0, 23),    # PADS_BANK1, same
+]
+
+NUM_RESET_REGS = 3
+
+# pad control, laid out like on the RP2040
+_PAD_FIELDS = {"SLEWFAST": 0x01, "SCHMITT": 0x02, "PDE": 0x04, "PUE": 0x08,
+               "DRIVE": 0x30, "IE": 0x40, "OD": 0x80}
+
+# first GPIO and number of GPIOs of each bank
+_GPIO_BANKS = [(0, 28), (28, 6), (34, 20)]
+
+def _registers():
+    regs = {
+        "SYSINFO": [("CHIP_ID", 0x00), ("PLATFORM", 0x04)],
+        # presumably PSM like on the RP2040, 0x100 selects PROC0
+        "POWER": [("WDSEL", 0x08, {"PROC0": 1 << 8})],
+        "WATCHDOG": [("CTRL", 0x00, {"TRIGGER": 1 << 31}),
+                     ("SCRATCH0", 0x0c), ("SCRATCH1", 0x10), ("SCRATCH3", 0x18)],
+    }
+    resets = collections.defaultdict(dict)
+    for name, _, _, _, rst in _PERIPHERALS:
+        if rst is not None:
+            resets[rst[0]][name] = 1 << rst[1]
+    for name, (reg, bit) in OTHER_RESETS.items():
+        resets[reg][name] = 1 << bit
+    regs["RESETS"] = [("RESET%d" % i, i * 4, resets[i]) for i in range(NUM_RESET_REGS)]
+
+    for bank, (first, count) in enumerate(_GPIO_BANKS):
+        regs["SYS_RIO%d" % bank] = [("OUT", 0x00), ("OE", 0x04), ("IN", 0x08)]
+        io = []
+        pads = [("VOLTAGE_SELECT", 0x00)]
+        for i in range(count):
+            io.append(("GPIO%d_STATUS" % (first + i), i * 8))
+            io.append(("GPIO%d_CTRL" % (first + i), i * 8 + 4, {"FUNCSEL": 0x1f}))
+            pads.append(("GPIO%d" % (first + i), 4 + i * 4, _PAD_FIELDS))
+        regs["IO_BANK%d" % bank] = io
+        regs["PADS_BANK%d" % bank] = pads
+    return regs
+
+
+class Register:
+    __slots__ = ("name", "block", "offset", "fields")
+
+    def __init__(self, name, block, offset, fields=None):
+        self.name = name
+        self.block = block
+        self.offset = offset
+        self.fields = fields or {}
+
+    @property
+    def addr(self):
+        return self.block.addr + self.offset
+
+    def decode(self, val):
+        """
+        Names of the fields, as name=value, or the single bit fields set in
+        val.
+        """
+        out = []
+        for name, mask in self.fields.items():
+            v = (val & mask) >> ((mask & -mask).bit_length() - 1)
+            if mask & (mask - 1):
+                out.append("%s=%d" % (name, v))
+            elif v:
+                out.append(name)
+        return out
+
+    def __repr__(self):
+        return "Register(%s.%s)" % (self.block.name, self.name)
+
+
+class Block:
+    """
+    An address range: a peripheral block or a memory. base is the offset
+    from PERIPH_BASE for peripherals, addr the address.
+    """
+    __slots__ = ("name", "addr", "size", "tag_off", "tag", "reset", "aliases", "probe", "regs", "_by_offset")
+
+    def __init__(self, name, addr, size, tag_off=None, tag=None, reset=None, aliases=False, probe=False):
+        self.name = name
+        self.addr = addr
+        self.size = size
+        self.tag_off = tag_off
+        self.tag = tag
+        self.reset = reset
+        self.aliases = aliases
+        self.probe = probe
+        self.regs = {}
+        self._by_offset = {}
+
+    @property
+    def base(self):
+        return self.addr - PERIPH_BASE
+
+    def add(self, name, offset, fields=None):
+        reg = Register(name, self, offset, fields)
+        self.regs[name] = reg
+        self._by_offset[offset] = reg
+        return reg
+
+    def __repr__(self):
+        return "Block(%s, %#x)" % (self.name, self.addr)
+
+
+MEMORIES = [
+    Block("ROM", ROM_BASE, ROM_WINDOW),
+    Block("LOCAL_RAM", LOCAL_RAM_BASE, LOCAL_RAM_SIZE),
+    Block("SRAM", SRAM_BASE, SRAM_SIZE),
+]
+
+BLOCKS = []
+for _name, _base, _tag_off, _tag, _rst in _PERIPHERALS:
+    _size = _SIZES.get(_name, BLOCK_SIZE)
+    BLOCKS.append(Block(_name, PERIPH_BASE + _base, _size, _tag_off, _tag, _rst,
+                        aliases=_size == BLOCK_SIZE, probe=_name not in DONT_PROBE))
+    if _tag is not None:
+        BLOCKS[-1].add("TAG", _tag_off)
+
+_by_name = {b.name: b for b in MEMORIES + BLOCKS}
+for _name, _regs in _registers().items():
+    for _reg in _regs:
+        _by_name[_name].add(*_reg)
+
+# the blocks resets.py and friends read when looking for differences
+PROBE_BLOCKS = [b for b in BLOCKS if b.probe]
+
+# interval index over everything
+_index = sorted(MEMORIES + BLOCKS, key=lambda b: b.addr)
+_starts = [b.addr for b in _index]
+
+RESETS_BASE = _by_name["RESETS"].addr
+RESETS_ASSERT = RESETS_BASE + ALIAS_SET
+RESETS_RELEASE = RESETS_BASE + ALIAS_CLR
+WATCHDOG_BASE = _by_name["WATCHDOG"].addr
+
+Location = collections.namedtuple("Location", "block offset alias reg")
+
+def block(name):
+    return _by_name[name]
+
+def addr(name):
+    """
+    Address of "BLOCK" or "BLOCK.REGISTER".
+    """
+    blk, _, reg = name.partition(".")
+    b = _by_name[blk]
+    return b.regs[reg].addr if reg else b.addr
+
+def lookup(address):
+    """
+    Returns the Location of an address, or None if it is in no known block.
+    offset is within the block with the alias bits removed, reg is None for
+    unnamed registers.
+    """
+    i = bisect.bisect_right(_starts, address) - 1
+    if i < 0:
+        return None
+    b = _index[i]
+    off = address - b.addr
+    if off >= b.size:
+        return None
+    alias = 0
+    if b.aliases:
+        alias = off & ALIAS_MASK
+        off &= ~ALIAS_MASK
+    return Location(b, off, alias, b._by_offset.get(off & ~3))
+
+def decode(address):
+    """
+    A name for an address, like "RESETS.RESET1:clr" or "UART0+0x024".
+    """
+    loc = lookup(address)
+    if loc is None:
+        return "%08x" % address
+    if loc.reg is not None:
+        name = "%s.%s" % (loc.block.name, loc.reg.name)
+        if loc.offset & 3:
+            name += "+%d" % (loc.offset & 3)
+    else:
+        name = "%s+%#05x" % (loc.block.name, loc.offset)
+    if loc.alias:
+        name += ":" + ALIAS_NAMES[loc.alias]
+    return name
+
+def reset_masks(names):
+    """
+    Masks per reset register for the reset bits of the named blocks. Blocks
+    without a known reset bit are a ValueError.
+    """
+    masks = [0] * NUM_RESET_REGS
+    for name in names:
+        rst = OTHER_RESETS[name] if name in OTHER_RESETS else _by_name[name].reset
+        if rst is None:
+            raise ValueError("no known reset bit for %s" % name)
+        reg, bit = rst
+        masks[reg] |= 1 << bit
+    return masks
+
+def hold(names):
+    """
+    Register writes that put the named blocks into reset.
+    """
+    return [(RESETS_ASSERT + i * 4, m) for i, m in enumerate(reset_masks(names)) if m]
+
+def release(names=None):
+    """
+    Register writes that take the named blocks, or everything, out of reset.
+    """
+    if names is None:
+        return [(RESETS_RELEASE + i * 4, 0xffffffff) for i in range(NUM_RESET_REGS)]
+    return [(RESETS_RELEASE + i * 4, m) for i, m in enumerate(reset_masks(names)) if m]
+
+def reset_bits():
+    """
+    The reset bits with something known behind them, as a list of bits per
+    reset register.
+    """
+    bits = [set() for _ in range(NUM_RESET_REGS)]
+    for b in BLOCKS:
+        if b.reset is not None:
+            bits[b.reset[0]].add(b.reset[1])
+    for reg, bit in OTHER_RESETS.values():
+        bits[reg].add(bit)
+    return [sorted(b) for b in bits]
@@ -0,0 +1,238 @@
+"""
+Software model of the RP1 as seen from the bootstrap I2C interface.
+
+SimRP1 is both a transport for rp1.bootstrap.Bootstrap and a RUN line, so the
+scripts in here can be run, profiled and benchmarked without a Pi 5:
+
+    sim = SimRP1()
+    rp1 = Bootstrap(sim, run_line=sim)
+
+What is modelled:
+
+* the boot ROM window at 0x00000000 (32K, mirrored once)
+* IRAM/DRAM at 0x10000000 and the SRAM at 0x20000000
+* the resets block at 0x40014000 and the atomic XOR/SET/CLR aliases at
+  +0x1000/+0x2000/+0x3000 of every peripheral block
+* peripherals held in reset read as 0 and drop writes, releasing a reset
+  brings the block back with its ID tag
+* the watchdog scratch registers and the boot handoff the videocore does
+* reset bits that kill the bootstrap I2C bus, like on the real thing
+
+Peripherals, tags and reset bits come from rp1.regmap. GUESSED_RESETS adds
+made up reset bits for some of the blocks without a known one, so the sweeps
+have something to find. They are not real, don't use them on the hardware.
+"""
+
+import errno
+import random
+
+from .regmap import (ALIAS_SET, ALIAS_XOR, BLOCK_MASK, BLOCKS, BOOTSTRAP_BUS_RESETS, CHIP_ID,
+                     LOCAL_RAM_BASE, LOCAL_RAM_SIZE, NUM_RESET_REGS, PERIPH_BASE, RESETS_BASE, ROM_SIZE,
+                     ROM_WINDOW, SRAM_BASE, SRAM_SIZE, WATCHDOG_BASE, WATCHDOG_BOOT_MAGIC)
+
+WATCHDOG_CTRL_TRIGGER = 0x80000000
+
+# reset bits nobody has seen doing anything yet, made up to fill the gaps
+GUESSED_RESETS = {
+    "CLOCKS_BANK_VIDEO": (2, 5),
+    "ADC": (0, 0),
+    "ETH_CFG": (0, 3),
+    "MIPI0_CSIDMA": (1, 0),
+    "MIPI0_MIPICFG": (1, 1),
+    "MIPI1_CSIDMA": (1, 2),
+    "MIPI1_MIPICFG": (1, 3),
+    "VIDEO_OUT_CFG": (2, 4),
+    "VIDEO_OUT_VEC": (2, 4),
+    "SDIO_CLOCKS": (1, 24),
+}
+
+
+class SimRP1:
+    """
+    Transport and RUN line in one. The RP1 starts out powered and running,
+    set_value(0) holds it in reset and set_value(1) boots it again.
+
+    rom is the content of the 32K boot ROM, by default random bytes.
+    rom_flip_rate is the chance of a flipped bit per byte for ROM reads longer
+    than 4 bytes, to mimic what the real chip does.
+    """
+    max_msgs = 42
+
+    def __init__(self, rom=None, rom_flip_rate=0.0, seed=0):
+        self._rng = random.Random(seed)
+        if rom is None:
+            rom = random.Random(0x8000).randbytes(ROM_SIZE)
+        # mirror the 32K so reads can simply slice the 64K window
+        self.rom = bytes(rom[:ROM_SIZE]) * 2
+        self.rom_flip_rate = rom_flip_rate
+
+        self.local_ram = bytearray(LOCAL_RAM_SIZE)
+        self.sram = bytearray(SRAM_SIZE)
+
+        # block base -> (reset reg, mask)
+        self._block_reset = {}
+        # block base -> {offset: value} of the reset values
+        self._defaults = {}
+        for b in BLOCKS:
+            defaults = self._defaults.setdefault(b.addr, {})
+            if b.tag is not None:
+                defaults[b.tag_off] = int.from_bytes(b.tag, "little")
+            rst = b.reset or GUESSED_RESETS.get(b.name)
+            if rst is not None:
+                self._block_reset[b.addr] = (rst[0], 1 << rst[1])
+        self._defaults[PERIPH_BASE][0] = CHIP_ID
+
+        self._bus_killers = [0] * NUM_RESET_REGS
+        for reg, bit in BOOTSTRAP_BUS_RESETS:
+            self._bus_killers[reg] |= 1 << bit
+
+        self.transfers = 0
+        self.messages = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        # (entry, sp) of every watchdog boot handoff
+        self.boots = []
+
+        self._power_on()
+
+    def _power_on(self):
+        self.running = True
+        self.bus_dead = False
+        self.sram[:] = bytes(SRAM_SIZE)
+        self.local_ram[:] = bytes(LOCAL_RAM_SIZE)
+        # block base -> {offset: value} of everything written
+        self._regs = {block: dict(d) for block, d in self._defaults.items()}
+        # everything is held in reset, except what keeps the bootstrap alive
+        self.resets = [0xffffffff & ~k for k in self._bus_killers]
+
+    # RUN line
+
+    def set_value(self, val):
+        if not val:
+            self.running = False
+        elif not self.running:
+            self._power_on()
+
+    # transport
+
+    def transfer(self, msgs):
+        if not self.running or self.bus_dead:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        self.transfers += 1
+        self.messages += len(msgs)
+        out = []
+        addr = 0
+        for m in msgs:
+            if m.__class__ is int:
+                out.append(self.read(addr, m))
+                self.bytes_read += m
+            else:
+                addr = (m[0] << 24) | (m[1] << 16) | (m[2] << 8) | m[3]
+                if len(m) > 4:
+                    self.write(addr, m[4:])
+                    self.bytes_written += len(m) - 4
+                    if self.bus_dead:
+                        raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        return out
+
+    # memory map
+
+    def read(self, addr, length):
+        region = addr >> 28
+        if region == 4:
+            if length == 4:
+                return self.read32(addr).to_bytes(4, "little")
+            return b"".join(self.read32(a).to_bytes(4, "little")
+                            for a in range(addr & ~3, addr + length, 4))[addr & 3:(addr & 3) + length]
+        if region == 2:
+            off = addr - SRAM_BASE
+            return bytes(self.sram[off:off + length]).ljust(length, b"\0")
+        if region == 1:
+            off = addr - LOCAL_RAM_BASE
+            return bytes(self.local_ram[off:off + length]).ljust(length, b"\0")
+        if region == 0:
+            off = addr & (ROM_WINDOW - 1)
+            data = self.rom[off:off + length].ljust(length, b"\0")
+            if length > 4 and self.rom_flip_rate:
+                data = self._flip_bits(data)
+            return data
+        return bytes(length)
+
+    def write(self, addr, data):
+        region = addr >> 28
+        if region == 4:
+            for i in range(0, len(data) & ~3, 4):
+                self.write32(addr + i, int.from_bytes(data[i:i + 4], "little"))
+        elif region == 2:
+            off = addr - SRAM_BASE
+            self.sram[off:off + len(data)] = data
+            del self.sram[SRAM_SIZE:]
+        elif region == 1:
+            off = addr - LOCAL_RAM_BASE
+            self.local_ram[off:off + len(data)] = data
+            del self.local_ram[LOCAL_RAM_SIZE:]
+
+    def read32(self, addr):
+        block = addr & BLOCK_MASK
+        rst = self._block_reset.get(block)
+        if rst is not None and self.resets[rst[0]] & rst[1]:
+            return 0
+        if block == RESETS_BASE:
+            off = addr & 0xfff
+            if off < NUM_RESET_REGS * 4:
+                return self.resets[off >> 2]
+        regs = self._regs.get(block)
+        if regs is None:
+            return 0
+        return regs.get(addr & 0xffc, 0)
+
+    def write32(self, addr, val):
+        block = addr & BLOCK_MASK
+        rst = self._block_reset.get(block)
+        if rst is not None and self.resets[rst[0]] & rst[1]:
+            return
+        off = addr & 0xffc
+        alias = addr & 0x3000
+
+        if block == RESETS_BASE and off < NUM_RESET_REGS * 4:
+            self._write_reset(off >> 2, self._apply_alias(self.resets[off >> 2], val, alias))
+            return
+
+        regs = self._regs.setdefault(block, {})
+        regs[off] = self._apply_alias(regs.get(off, 0), val, alias)
+
+        if block == WATCHDOG_BASE and off == 0 and regs[0] & WATCHDOG_CTRL_TRIGGER:
+            regs[0] &= ~WATCHDOG_CTRL_TRIGGER
+            if regs.get(0x0c) == WATCHDOG_BOOT_MAGIC:
+                self.boots.append((regs.get(0x10, 0) ^ WATCHDOG_BOOT_MAGIC, regs.get(0x18, 0)))
+
+    @staticmethod
+    def _apply_alias(old, val, alias):
+        if alias == 0:
+            return val
+        if alias == ALIAS_XOR:
+            return old ^ val
+        if alias == ALIAS_SET:
+            return old | val
+        return old & ~val
+
+    def _write_reset(self, idx, val):
+        asserted = val & ~self.resets[idx]
+        self.resets[idx] = val
+        if not asserted:
+            return
+        if asserted & self._bus_killers[idx]:
+            self.bus_dead = True
+        # blocks going into reset lose everything written to them
+        for block, (reg, mask) in self._block_reset.items():
+            if reg == idx and asserted & mask:
+                self._regs[block] = dict(self._defaults.get(block, {}))
+
+    def _flip_bits(self, data):
+        rng = self._rng
+        rate = self.rom_flip_rate
+        data = bytearray(data)
+        for i in range(len(data)):
+            if rng.random() < rate:
+                data[i] ^= 1 << rng.randrange(8)
+        return bytes(data)
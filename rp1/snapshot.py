@@ -0,0 +1,158 @@
+"""
+Snapshots of the peripheral registers and diffs between them.
+
+A Snapshot is a list of regions (name, address, length) and one preallocated
+buffer all of them are read into, either over the bootstrap I2C interface or
+from the PCIe BARs. Saved, it is a small header, the region table and the
+raw buffer:
+
+    magic "RP1SNAP\\0", version, number of regions, time, source
+    per region: address, length, name
+    the data of all regions back to back
+
+diff() compares two snapshots region by region and only looks at the words
+of regions, and 64 byte chunks within them, that aren't identical.
+"""
+
+import struct
+import time
+
+from . import regmap
+
+MAGIC = b"RP1SNAP\0"
+VERSION = 1
+
+# the part of a block below the atomic aliases
+DEFAULT_SPAN = regmap.ALIAS_XOR
+
+_HEADER = struct.Struct("<8sIId16s")
+_REGION = struct.Struct("<II24s")
+
+_CHUNK = 64
+
+
+class Snapshot:
+    def __init__(self, regions, data=None, taken=None, source=""):
+        self.regions = list(regions)
+        self.offsets = []
+        size = 0
+        for name, addr, length in self.regions:
+            self.offsets.append(size)
+            size += length
+        self.data = bytearray(size) if data is None else data
+        if len(self.data) != size:
+            raise ValueError("snapshot data is %d bytes, regions need %d" % (len(self.data), size))
+        self.taken = taken
+        self.source = source
+
+    @classmethod
+    def of_blocks(cls, blocks=None, span=DEFAULT_SPAN):
+        """
+        An empty snapshot of the first span bytes of every block, by default
+        the ones that are safe to read.
+        """
+        if blocks is None:
+            blocks = regmap.PROBE_BLOCKS
+        return cls([(b.name, b.addr, min(span, b.size)) for b in blocks])
+
+    def region(self, i):
+        off = self.offsets[i]
+        return memoryview(self.data)[off:off + self.regions[i][2]]
+
+    def capture_i2c(self, rp1, chunk=_CHUNK):
+        """
+        Reads every region over the bootstrap interface, as one batch.
+        """
+        b = rp1.batch()
+        dests = []
+        for i, (name, addr, length) in enumerate(self.regions):
+            base = self.offsets[i]
+            for off in range(0, length, chunk):
+                n = min(chunk, length - off)
+                b.read(addr + off, n)
+                dests.append(base + off)
+        data = self.data
+        for dest, part in zip(dests, b.run()):
+            data[dest:dest + len(part)] = part
+        self.taken = time.time()
+        self.source = "i2c"
+        return self
+
+    def capture_bars(self, bars):
+        """
+        Copies every region out of BAR1 (peripherals) or BAR2 (SRAM) of an
+        rp1.pcie.RP1Bars.
+        """
+        for i, (name, addr, length) in enumerate(self.regions):
+            bars.read_into(addr, self.region(i))
+        self.taken = time.time()
+        self.source = "pcie"
+        return self
+
+    def word(self, addr):
+        """
+        The 32 bit word at addr, or None if it isn't in the snapshot.
+        """
+        for i, (name, base, length) in enumerate(self.regions):
+            if base <= addr and addr + 4 <= base + length:
+                return struct.unpack_from("<I", self.data, self.offsets[i] + addr - base)[0]
+        return None
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(self.regions), self.taken or 0.0, self.source.encode()))
+            for name, addr, length in self.regions:
+                f.write(_REGION.pack(addr, length, name.encode()))
+            f.write(self.data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        magic, version, count, taken, source = _HEADER.unpack_from(raw, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s: not a snapshot" % path)
+        pos = _HEADER.size
+        regions = []
+        for _ in range(count):
+            addr, length, name = _REGION.unpack_from(raw, pos)
+            regions.append((name.rstrip(b"\0").decode(), addr, length))
+            pos += _REGION.size
+        return cls(regions, bytearray(raw[pos:]), taken, source.rstrip(b"\0").decode())
+
+
+def diff(a, b, ignore=frozenset()):
+    """
+    Returns (addr, old, new) for every 32 bit word that differs between
+    the regions the two snapshots have in common. Addresses in ignore are
+    left out.
+    """
+    b_regions = {(addr, length): i for i, (name, addr, length) in enumerate(b.regions)}
+    changes = []
+    for i, (name, addr, length) in enumerate(a.regions):
+        j = b_regions.get((addr, length))
+        if j is None:
+            continue
+        ra, rb = a.region(i), b.region(j)
+        if ra == rb:
+            continue
+        wa, wb = ra[:length & ~3].cast("I"), rb[:length & ~3].cast("I")
+        for off in range(0, length & ~3, _CHUNK):
+            if ra[off:off + _CHUNK] == rb[off:off + _CHUNK]:
+                continue
+            for w in range(off >> 2, min(off + _CHUNK, length & ~3) >> 2):
+                if wa[w] != wb[w] and addr + w * 4 not in ignore:
+                    changes.append((addr + w * 4, wa[w], wb[w]))
+    return changes
+
+
+def format_change(addr, old, new):
+    """
+    One line for a changed word, with the register and field names where
+    the register map knows them.
+    """
+    line = "%08x %-28s %08x -> %08x" % (addr, regmap.decode(addr), old, new)
+    loc = regmap.lookup(addr)
+    if loc is not None and loc.reg is not None and loc.reg.fields:
+        line += "  [%s] -> [%s]" % (" ".join(loc.reg.decode(old)), " ".join(loc.reg.decode(new)))
+    return line
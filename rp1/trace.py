@@ -0,0 +1,281 @@
+"""
+Records every transaction on the bootstrap bus, to see where the time goes.
+
+A Tracer sits between a Bootstrap and its transport (and RUN line) and
+writes a binary trace:
+
+    magic "RP1TRACE", version, flags, max_msgs of the transport, start time
+    records: kind, start and end in ns since the start, errno, count
+        a transfer has count messages: address, direction, length, data
+        a RUN line change has the new value as count and no messages
+
+Writes always carry their data, so a trace can be replayed. Reads carry
+what came back unless the Tracer was made with read_data=False, which keeps
+traces of long sweeps small.
+
+    rp1 = Bootstrap(run_line=GpiodRunLine())
+    tracer = attach(rp1, open("run.trace", "wb"))
+    ...
+    tracer.close()
+
+replay() sends the transfers of a trace to another transport, e.g. a SimRP1,
+and summarize() turns a trace into per operation latencies and throughput.
+"""
+
+import collections
+import io
+import struct
+import time
+
+from .bootstrap import split_transfers
+
+MAGIC = b"RP1TRACE"
+VERSION = 1
+
+# record kinds
+XFER = 0
+RUN = 1
+
+# message directions
+WRITE = 0
+READ = 1
+
+# header flags
+FLAG_READ_DATA = 1
+
+_HEADER = struct.Struct("<8sIIId")
+_RECORD = struct.Struct("<BQQiH")
+_MSG = struct.Struct("<IBH")
+
+# the trace is written in pieces of this size
+_FLUSH = 64 * 1024
+
+Transfer = collections.namedtuple("Transfer", "start end errno msgs")
+Message = collections.namedtuple("Message", "addr dir length data")
+RunEvent = collections.namedtuple("RunEvent", "time value")
+
+
+class Tracer:
+    """
+    Transport and RUN line in one, passing everything on to transport and
+    run_line. out is a file opened for binary writing. With keep set, the
+    records are also collected in self.records.
+    """
+    def __init__(self, transport, out, run_line=None, read_data=True, keep=False):
+        self.transport = transport
+        self.run_line = run_line
+        self.max_msgs = transport.max_msgs
+        self.out = out
+        self.read_data = read_data
+        self.records = [] if keep else None
+        self._log = bytearray()
+        self._t0 = time.perf_counter_ns()
+        out.write(_HEADER.pack(MAGIC, VERSION, FLAG_READ_DATA if read_data else 0, self.max_msgs, time.time()))
+
+    def transfer(self, msgs):
+        start = time.perf_counter_ns()
+        try:
+            results = self.transport.transfer(msgs)
+        except OSError as err:
+            self._transfer(start, time.perf_counter_ns(), err.errno or -1, msgs, None)
+            raise
+        self._transfer(start, time.perf_counter_ns(), 0, msgs, results)
+        return results
+
+    def set_value(self, val):
+        t = time.perf_counter_ns() - self._t0
+        self._log += _RECORD.pack(RUN, t, t, 0, val)
+        if self.records is not None:
+            self.records.append(RunEvent(t, val))
+        self.run_line.set_value(val)
+
+    def _transfer(self, start, end, err, msgs, results):
+        log = self._log
+        log += _RECORD.pack(XFER, start - self._t0, end - self._t0, err, len(msgs))
+        keep = [] if self.records is not None else None
+        addr = 0
+        r = 0
+        for m in msgs:
+            if m.__class__ is int:
+                data = results[r] if results is not None and self.read_data else b""
+                r += 1
+                log += _MSG.pack(addr, READ, m)
+                log += data
+                if keep is not None:
+                    keep.append(Message(addr, READ, m, data))
+            else:
+                addr = int.from_bytes(m[:4], "big")
+                log += _MSG.pack(addr, WRITE, len(m) - 4)
+                log += m[4:]
+                if keep is not None:
+                    keep.append(Message(addr, WRITE, len(m) - 4, bytes(m[4:])))
+        if keep is not None:
+            self.records.append(Transfer(start - self._t0, end - self._t0, err, keep))
+        if len(log) >= _FLUSH:
+            self.flush()
+
+    def flush(self):
+        self.out.write(self._log)
+        self._log = bytearray()
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+
+def attach(rp1, out, read_data=True):
+    """
+    Puts a Tracer between an rp1.bootstrap.Bootstrap and its transport and
+    RUN line. Returns the Tracer, close() it when done.
+    """
+    tracer = Tracer(rp1.transport, out, rp1.run_line, read_data)
+    rp1.transport = tracer
+    if rp1.run_line is not None:
+        rp1.run_line = tracer
+    return tracer
+
+
+def parse(raw):
+    """
+    Returns (start time, max_msgs, read data flag, records) of a trace,
+    records being Transfers and RunEvents in order.
+    """
+    raw = memoryview(raw)
+    magic, version, flags, max_msgs, started = _HEADER.unpack_from(raw, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a bootstrap trace")
+    read_data = bool(flags & FLAG_READ_DATA)
+    records = []
+    pos = _HEADER.size
+    n = len(raw)
+    try:
+        while pos < n:
+            kind, start, end, err, count = _RECORD.unpack_from(raw, pos)
+            pos += _RECORD.size
+            if kind == RUN:
+                records.append(RunEvent(start, count))
+                continue
+            msgs = []
+            for _ in range(count):
+                addr, d, length = _MSG.unpack_from(raw, pos)
+                pos += _MSG.size
+                size = length if d == WRITE or (read_data and not err) else 0
+                if pos + size > n:
+                    raise struct.error("short message")
+                msgs.append(Message(addr, d, length, bytes(raw[pos:pos + size])))
+                pos += size
+            records.append(Transfer(start, end, err, msgs))
+    except struct.error:
+        # a trace cut short by a crash ends in a partial record
+        pass
+    return started, max_msgs, read_data, records
+
+def read_trace(path):
+    with open(path, "rb") as f:
+        return parse(f.read())
+
+
+def _msgs(t):
+    return [m.length if m.dir == READ else m.addr.to_bytes(4, "big") + m.data for m in t.msgs]
+
+def replay(records, transport, run_line=None, out=None, read_data=True):
+    """
+    Sends the transfers in records to transport again, in order and as fast
+    as it takes them, and passes RUN line changes to run_line if given.
+    Failing transfers don't stop the replay. Returns the records of the
+    replay, which are also written to out if given.
+
+    Transfers longer than max_msgs of the transport are split with
+    rp1.bootstrap.split_transfers().
+    """
+    tracer = Tracer(transport, io.BytesIO() if out is None else out, run_line, read_data, keep=True)
+    max_msgs = transport.max_msgs
+    for r in records:
+        if r.__class__ is RunEvent:
+            if run_line is not None:
+                tracer.set_value(r.value)
+            continue
+        for part in split_transfers(_msgs(r), max_msgs):
+            try:
+                tracer.transfer(part)
+            except OSError:
+                pass
+    tracer.flush()
+    return tracer.records
+
+def compare(recorded, replayed):
+    """
+    Returns the number of transfers whose outcome differs between two runs
+    of the same transfers: a different errno or different read data, if both
+    have it. Only meaningful if nothing was split in between.
+    """
+    a = [r for r in recorded if r.__class__ is Transfer]
+    b = [r for r in replayed if r.__class__ is Transfer]
+    differ = abs(len(a) - len(b))
+    for x, y in zip(a, b):
+        if x.errno != y.errno:
+            differ += 1
+        elif any(m.dir == READ and m.data and n.data and m.data != n.data for m, n in zip(x.msgs, y.msgs)):
+            differ += 1
+    return differ
+
+
+# summaries
+
+OpStats = collections.namedtuple("OpStats", "count failed msgs written read busy latencies errnos")
+
+def operation(t):
+    """
+    What a transfer does: "read", "write", "read+write" or "addr" for
+    address writes without data.
+    """
+    reads = writes = False
+    for m in t.msgs:
+        if m.dir == READ:
+            reads = True
+        elif m.length:
+            writes = True
+    if reads:
+        return "read+write" if writes else "read"
+    return "write" if writes else "addr"
+
+def summarize(records):
+    """
+    Returns {operation: OpStats} for the transfers in records, latencies in ns
+    and sorted. written and read count the data bytes of successful
+    transfers.
+    """
+    ops = {}
+    for t in records:
+        if t.__class__ is not Transfer:
+            continue
+        ops.setdefault(operation(t), []).append(t)
+    out = {}
+    for op, ts in sorted(ops.items()):
+        ok = [t for t in ts if not t.errno]
+        out[op] = OpStats(
+            count=len(ts),
+            failed=len(ts) - len(ok),
+            msgs=sum(len(t.msgs) for t in ts),
+            written=sum(m.length for t in ok for m in t.msgs if m.dir == WRITE),
+            read=sum(m.length for t in ok for m in t.msgs if m.dir == READ),
+            busy=sum(t.end - t.start for t in ts),
+            latencies=sorted(t.end - t.start for t in ts),
+            errnos=collections.Counter(t.errno for t in ts if t.errno),
+        )
+    return out
+
+def percentile(latencies, p):
+    if not latencies:
+        return 0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+def histogram(latencies):
+    """
+    Returns (from, to, count) for power of two buckets of ns, from the
+    fastest to the slowest bucket used.
+    """
+    counts = collections.Counter(ns.bit_length() for ns in latencies)
+    if not counts:
+        return []
+    return [((1 << b) >> 1, 1 << b, counts[b]) for b in range(min(counts), max(counts) + 1)]
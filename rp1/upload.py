@@ -0,0 +1,404 @@
+"""
+Uploading code and data over the bootstrap interface.
+
+The image is cut into writes of up to 64 bytes and pushed out in as few
+i2c_rdwr ioctls as possible. If the target memory is known to hold a fill value
+(e.g. all 0x00 after a reset), blocks that only contain the fill value are
+skipped and the remaining runs are trimmed to the data that actually differs.
+Register writes like the watchdog boot handoff follow in an ioctl of their own,
+which is never retried.
+
+upload_diff() keeps a manifest of what was last written to every 64 byte block
+and only sends the blocks that changed since, which turns reloading a payload
+after a small edit into a few writes. The payload runs between loads and
+changes its own data, so the blocks of writable sections are always sent. A
+few of the other blocks are sampled to catch a manifest that went stale.
+
+read_image() turns a payload into what has to be written where: a flat binary
+goes to 0x20000000 as a whole, an ELF only brings the contents of its PT_LOAD
+segments, wherever they are linked to. .bss and the gaps between segments are
+never sent, the startup code clears .bss itself.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import random
+import struct
+import time
+
+from . import elf
+from .bootstrap import MAX_XFER_LEN
+from .regmap import LOCAL_RAM_BASE, LOCAL_RAM_SIZE, SRAM_BASE, SRAM_SIZE, WATCHDOG_BOOT_MAGIC, addr
+
+# what the payloads were always started with, the bootloader's values
+DEFAULT_ENTRY = 0x20000001
+DEFAULT_SP = 0x100030d0
+
+# the symbol payload/*/linker.ld puts at the top of the stack
+STACK_SYMBOL = "__stack_end__"
+
+# unchanged blocks sampled by upload_diff() by default
+VERIFY_SAMPLES = 4
+
+# bytes read back from every sampled block when verifying a manifest
+VERIFY_SAMPLE_LEN = 8
+
+# successful transfers in a row after which _send() tries twice as many
+# messages per transfer again
+GROW_AFTER = 8
+
+
+def boot_regs(entry, sp):
+    """
+    Register writes that make the RP1 boot from entry (don't forget the thumb
+    bit) with the given stack pointer, like the videocore does.
+    """
+    return [
+        (addr("WATCHDOG.SCRATCH0"), WATCHDOG_BOOT_MAGIC),
+        (addr("WATCHDOG.SCRATCH1"), WATCHDOG_BOOT_MAGIC ^ entry),
+        (addr("WATCHDOG.SCRATCH3"), sp),
+
+        # watchdog reset selection, presumably PROC0, then trigger it
+        (addr("POWER.WDSEL"), 0x100),
+        (addr("WATCHDOG.CTRL"), 0x80000000),
+    ]
+
+
+Image = collections.namedtuple("Image", "pieces entry sp writable")
+
+
+def _in_ram(a):
+    return (LOCAL_RAM_BASE <= a <= LOCAL_RAM_BASE + LOCAL_RAM_SIZE or
+            SRAM_BASE <= a <= SRAM_BASE + SRAM_SIZE)
+
+def _vectors(pieces):
+    """
+    Initial SP and reset vector, if the lowest piece starts with something
+    that looks like a vector table: a word aligned SP in RAM and a Thumb
+    pointer into the image.
+    """
+    base, data = min(pieces, default=(0, b""))
+    if len(data) < 8:
+        return None
+    sp, reset = struct.unpack_from("<II", data)
+    if sp & 3 or not _in_ram(sp) or not reset & 1:
+        return None
+    if not any(a <= reset & ~1 < a + len(d) for a, d in pieces):
+        return None
+    return reset, sp
+
+def _elf_pieces(e):
+    """
+    The file contents of the PT_LOAD segments as (addr, bytes), with the
+    NOBITS sections cut out that the linker filled with zeros because
+    something with contents came after them in the same segment.
+    """
+    nobits = [(s.addr, s.addr + s.size) for s in e.sections
+              if s.type == elf.SHT_NOBITS and s.flags & elf.SHF_ALLOC and s.size]
+    pieces = []
+    for seg in e.segments:
+        if seg.type != elf.PT_LOAD or not seg.filesz:
+            continue
+        data = e.data[seg.offset:seg.offset + seg.filesz]
+        # paddr is where the contents are loaded, it's the same as vaddr for
+        # everything linked with payload/*/linker.ld
+        start, end = seg.paddr, seg.paddr + seg.filesz
+        cuts = sorted((max(a, start), min(b, end)) for a, b in nobits if a < end and b > start)
+        pos = start
+        for a, b in cuts + [(end, end)]:
+            if a > pos:
+                pieces.append((pos, bytes(data[pos - start:a - start])))
+            pos = max(pos, b)
+    return sorted(pieces)
+
+def read_image(data, entry=None, sp=None):
+    """
+    Returns an Image: the (addr, bytes) pieces of a payload, flat binary or
+    ELF, the entry point and initial SP to boot it with and the (start, end)
+    ranges of uploaded data the payload may change while it runs, the
+    writable sections of an ELF. A flat binary doesn't say, writable is
+    empty for it.
+
+    Whatever isn't given is derived: from a vector table at the start of the
+    image if there is one, else the entry from the ELF header and the SP from
+    the __stack_end__ symbol, else the old defaults.
+    """
+    data = bytes(data)
+    if data[:4] != b"\x7fELF":
+        pieces = [(SRAM_BASE, data)]
+        e_entry = e_sp = None
+        writable = []
+    else:
+        e = elf.ELF(data)
+        pieces = _elf_pieces(e)
+        writable = [(s.addr, s.addr + s.size) for s in e.sections
+                    if s.flags & elf.SHF_ALLOC and s.flags & elf.SHF_WRITE and s.type != elf.SHT_NOBITS and s.size]
+        e_entry = e.entry or None
+        e_sp = next((s.value for s in e.symbols() if s.name == STACK_SYMBOL), None)
+
+    vectors = _vectors(pieces) or (None, None)
+    if entry is None:
+        entry = vectors[0] or e_entry or DEFAULT_ENTRY
+    if sp is None:
+        sp = vectors[1] or e_sp or DEFAULT_SP
+    # Cortex-M only knows Thumb, startup.s doesn't mark start as a Thumb
+    # function though
+    return Image(pieces, entry | 1, sp, writable)
+
+
+class UploadStats:
+    def __init__(self, total):
+        self.total = total
+        self.sent = 0
+        self.writes = 0
+        self.transfers = 0
+        self.retries = 0
+        self.elapsed = 0.0
+
+    def __iadd__(self, other):
+        self.total += other.total
+        self.sent += other.sent
+        self.writes += other.writes
+        self.transfers += other.transfers
+        self.retries += other.retries
+        self.elapsed += other.elapsed
+        return self
+
+    def __str__(self):
+        rate = self.total / self.elapsed / 1024 if self.elapsed else 0
+        return (f"{self.sent}/{self.total} bytes sent in {self.writes} writes, "
+                f"{self.transfers} transfers, {self.retries} retries, "
+                f"{self.elapsed*1000:.1f} ms, {rate:.1f} KiB/s")
+
+
+def plan_writes(addr, data, blank=None):
+    """
+    Returns the list of (addr, bytes) writes needed to put data at addr.
+
+    blank is the byte value the target memory already holds, or None if the
+    content is unknown. Blocks of 64 bytes that only contain it are left out
+    and the remaining runs are trimmed to whole words that differ.
+    """
+    data = bytes(data)
+    n = len(data)
+    if blank is None:
+        return [(addr + off, data[off:off + MAX_XFER_LEN]) for off in range(0, n, MAX_XFER_LEN)]
+
+    fill = bytes([blank]) * MAX_XFER_LEN
+    writes = []
+    off = 0
+    while off < n:
+        # skip blank blocks
+        while off < n and data[off:off + MAX_XFER_LEN] == fill[:min(MAX_XFER_LEN, n - off)]:
+            off += MAX_XFER_LEN
+        if off >= n:
+            break
+        start = off
+        while off < n and data[off:off + MAX_XFER_LEN] != fill[:min(MAX_XFER_LEN, n - off)]:
+            off += MAX_XFER_LEN
+        end = min(off, n)
+
+        # trim the blank bytes at both ends of the run, keeping words intact
+        run = data[start:end]
+        pad = fill[:1]
+        first = start + ((len(run) - len(run.lstrip(pad))) & ~3)
+        last = min(n, start + ((len(run.rstrip(pad)) + 3) & ~3))
+        for o in range(first, last, MAX_XFER_LEN):
+            writes.append((addr + o, data[o:min(o + MAX_XFER_LEN, last)]))
+    return writes
+
+
+def _send(rp1, writes, stats):
+    """
+    Pushes out a list of (addr, bytes) memory writes. Transfers that fail are
+    retried with half the messages per ioctl, which doubles again after
+    GROW_AFTER good ones, so a single glitch doesn't slow down the rest of the
+    upload. Plain memory writes are idempotent, so redoing part of a transfer
+    does no harm. Register writes are not, they go through _send_regs().
+    """
+    transfers = rp1.transfers
+    max_msgs = rp1.transport.max_msgs
+    per_xfer = max_msgs
+    good = 0
+    i = 0
+    while i < len(writes):
+        b = rp1.batch()
+        for a, chunk in writes[i:i + per_xfer]:
+            b.write(a, chunk)
+        try:
+            b.run()
+        except OSError:
+            if per_xfer == 1:
+                raise
+            per_xfer //= 2
+            good = 0
+            stats.retries += 1
+            continue
+        i += per_xfer
+        good += 1
+        if good == GROW_AFTER and per_xfer < max_msgs:
+            per_xfer = min(per_xfer * 2, max_msgs)
+            good = 0
+    stats.transfers += rp1.transfers - transfers
+
+
+def _send_regs(rp1, regs, stats):
+    """
+    Writes the (addr, val) pairs in regs as one final batch that is never
+    retried. The boot handoff triggers the watchdog, if the RP1 NAKs because
+    it already reset, sending it again would fire it a second time under the
+    running firmware.
+    """
+    if not regs:
+        return
+    transfers = rp1.transfers
+    b = rp1.batch()
+    for a, val in regs:
+        b.write_reg(a, val)
+    try:
+        b.run()
+    finally:
+        stats.transfers += rp1.transfers - transfers
+
+
+def upload(rp1, addr, data, blank=None, regs=()):
+    """
+    Writes data to addr, followed by the (addr, val) register writes in regs.
+    Returns an UploadStats.
+    """
+    return upload_pieces(rp1, [(addr, data)], blank, regs)
+
+
+def upload_pieces(rp1, pieces, blank=None, regs=()):
+    """
+    Like upload(), for a list of (addr, bytes), e.g. Image.pieces. Everything
+    goes out in one go.
+    """
+    stats = UploadStats(sum(len(data) for _, data in pieces))
+    start = time.perf_counter()
+
+    writes = []
+    for addr, data in pieces:
+        writes += plan_writes(addr, data, blank)
+    stats.writes = len(writes)
+    stats.sent = sum(len(chunk) for _, chunk in writes)
+    _send(rp1, writes, stats)
+    _send_regs(rp1, regs, stats)
+
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+class Manifest:
+    """
+    Content hashes of what was last written to every 64 byte block of a memory
+    region, kept in a JSON file between runs. Blocks that were never written,
+    or whose content is unknown, have no hash.
+    """
+    def __init__(self, path, base=SRAM_BASE, size=SRAM_SIZE, block=MAX_XFER_LEN):
+        self.path = path
+        self.base = base
+        self.block = block
+        self.hashes = [None] * (size // block)
+        if os.path.exists(path):
+            m = json.load(open(path))
+            if m["base"] == base and m["block"] == block and len(m["hashes"]) == len(self.hashes):
+                self.hashes = m["hashes"]
+
+    @staticmethod
+    def digest(chunk):
+        return hashlib.blake2b(chunk, digest_size=8).hexdigest()
+
+    def covers(self, addr, length):
+        """
+        Whether addr is block aligned and addr..addr+length is inside.
+        """
+        off = addr - self.base
+        return off >= 0 and off % self.block == 0 and off + length <= len(self.hashes) * self.block
+
+    def invalidate(self):
+        self.hashes = [None] * len(self.hashes)
+
+    def save(self):
+        m = {"base": self.base, "block": self.block, "hashes": self.hashes}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(m, f)
+        os.replace(tmp, self.path)
+
+
+def upload_diff(rp1, addr, data, manifest, verify=VERIFY_SAMPLES, regs=(), volatile=()):
+    """
+    Like upload(), but only sends the blocks whose content differs from what
+    the manifest says was written last time. addr has to be block aligned.
+
+    Blocks touching the (start, end) ranges in volatile, the data the payload
+    changes while it runs, are always sent.
+
+    The manifest can't know what else wrote to the RAM since. verify of the
+    supposedly unchanged blocks are sampled by reading back a few bytes of
+    each. If any of them doesn't match, the manifest is stale (the RP1 was
+    reset or something else wrote there) and everything is sent. verify=0
+    trusts the manifest. verify="all" reads back every one of them and sends
+    the ones that differ, which costs about as much as sending them all.
+    """
+    block = manifest.block
+    first = (addr - manifest.base) // block
+    if not manifest.covers(addr, len(data)):
+        raise ValueError("%#x is not a block aligned address inside the manifest" % addr)
+
+    stats = UploadStats(len(data))
+    start = time.perf_counter()
+
+    data = bytes(data)
+    blocks = [data[off:off + block] for off in range(0, len(data), block)]
+    digests = [Manifest.digest(chunk) for chunk in blocks]
+    for lo, hi in volatile:
+        for i in range(max(0, (lo - addr) // block), min(len(blocks), (hi - addr + block - 1) // block)):
+            manifest.hashes[first + i] = None
+    changed = [i for i, d in enumerate(digests) if manifest.hashes[first + i] != d]
+
+    if verify != 0 and len(changed) < len(blocks):
+        changed_set = set(changed)
+        same = [i for i in range(len(blocks)) if i not in changed_set]
+        b = rp1.batch()
+        transfers = rp1.transfers
+        if verify == "all":
+            for i in same:
+                b.read(addr + i * block, len(blocks[i]))
+            changed = sorted(changed_set | {i for i, got in zip(same, b.run()) if got != blocks[i]})
+        else:
+            sample = random.sample(same, min(verify, len(same)))
+            expected = []
+            for i in sample:
+                chunk = blocks[i]
+                off = random.randrange(0, max(1, len(chunk) - VERIFY_SAMPLE_LEN + 1)) & ~3
+                expected.append(chunk[off:off + VERIFY_SAMPLE_LEN])
+                b.read(addr + i * block + off, len(expected[-1]))
+            if b.run() != expected:
+                manifest.invalidate()
+                changed = list(range(len(blocks)))
+        stats.transfers += rp1.transfers - transfers
+
+    writes = [(addr + i * block, blocks[i]) for i in changed]
+    stats.writes = len(writes)
+    stats.sent = sum(len(chunk) for _, chunk in writes)
+
+    # forget the blocks we are about to touch, so a failed upload can't leave
+    # a manifest claiming content that never made it to the RP1
+    for i in changed:
+        manifest.hashes[first + i] = None
+    manifest.save()
+
+    _send(rp1, writes, stats)
+
+    for i in changed:
+        manifest.hashes[first + i] = digests[i]
+    manifest.save()
+
+    _send_regs(rp1, regs, stats)
+
+    stats.elapsed = time.perf_counter() - start
+    return stats
@@ -0,0 +1,165 @@
+"""
+Polls RP1 registers and memory and logs only what changes.
+
+A Watcher reads its targets, a list of (name, addr, length), into one of two
+Snapshots per sample and compares it with the other one, which holds the
+previous sample. Most samples change nothing and cost a single compare.
+
+The log is binary:
+
+    magic "RP1WATCH", version, number of targets, start time, interval
+    per target: address, length, name
+    events: time since the start in ns, address, new value
+
+The first sample logs every word. A MISSED event (address 0xffffffff) says
+how many samples were skipped because the previous ones ran late.
+"""
+
+import struct
+import time
+
+from .snapshot import Snapshot
+
+MAGIC = b"RP1WATCH"
+VERSION = 1
+
+MISSED = 0xffffffff
+
+_HEADER = struct.Struct("<8sIIdd")
+_TARGET = struct.Struct("<II24s")
+_EVENT = struct.Struct("<QII")
+
+# the log is written in pieces of this size
+_FLUSH = 64 * 1024
+
+# waits shorter than this are spun instead of slept
+_SPIN = 0.001
+
+
+class Watcher:
+    """
+    dev is an rp1.pcie.RP1Bars or an rp1.bootstrap.Bootstrap, out a file
+    opened for binary writing. Everything is logged in words, so target
+    lengths are rounded up to a multiple of 4.
+    """
+    def __init__(self, dev, targets, out):
+        targets = [(name, addr, (length + 3) & ~3) for name, addr, length in targets]
+        self.prev = Snapshot(targets)
+        self.cur = Snapshot(targets)
+        # the bootstrap interface reads everything in one batch
+        self._i2c = hasattr(dev, "batch")
+        self.dev = dev
+        self.out = out
+        self._log = bytearray()
+        self._t0 = None
+        self.samples = 0
+        self.changes = 0
+        self.missed = 0
+
+    def _capture(self, snap):
+        if self._i2c:
+            snap.capture_i2c(self.dev)
+        else:
+            snap.capture_bars(self.dev)
+
+    def _event(self, t, addr, val):
+        self._log += _EVENT.pack(t, addr, val)
+        if len(self._log) >= _FLUSH:
+            self.flush()
+
+    def start(self, interval=0.0):
+        self._t0 = time.monotonic_ns()
+        self.out.write(_HEADER.pack(MAGIC, VERSION, len(self.cur.regions), time.time(), interval))
+        for name, addr, length in self.cur.regions:
+            self.out.write(_TARGET.pack(addr, length, name.encode()))
+        # everything is new in the first sample
+        self._capture(self.prev)
+        t = time.monotonic_ns() - self._t0
+        for i, (name, addr, length) in enumerate(self.prev.regions):
+            for w, val in enumerate(self.prev.region(i).cast("I")):
+                self._event(t, addr + w * 4, val)
+        self.samples = 1
+
+    def sample(self):
+        """
+        Takes one sample and logs the changes, returns how many there were.
+        """
+        cur, prev = self.cur, self.prev
+        self._capture(cur)
+        t = time.monotonic_ns() - self._t0
+        self.samples += 1
+        # the next sample goes into what is now the old one
+        self.cur, self.prev = prev, cur
+        if cur.data == prev.data:
+            return 0
+        n = 0
+        for i, (name, addr, length) in enumerate(cur.regions):
+            rc, rp = cur.region(i), prev.region(i)
+            if rc == rp:
+                continue
+            wc, wp = rc.cast("I"), rp.cast("I")
+            for w in range(len(wc)):
+                if wc[w] != wp[w]:
+                    self._event(t, addr + w * 4, wc[w])
+                    n += 1
+        self.changes += n
+        return n
+
+    def run(self, interval, duration=None, count=None):
+        """
+        Samples every interval seconds (0 for as fast as possible) for
+        duration seconds, count samples or until interrupted. Deadlines
+        that pass before a sample started are logged as missed.
+        """
+        if self._t0 is None:
+            self.start(interval)
+        start = time.monotonic()
+        end = None if duration is None else start + duration
+        deadline = start + interval
+        try:
+            while count is None or self.samples < count:
+                now = time.monotonic()
+                if end is not None and now >= end:
+                    break
+                if now < deadline:
+                    if deadline - now > _SPIN:
+                        time.sleep(deadline - now - _SPIN)
+                    while time.monotonic() < deadline:
+                        pass
+                elif interval and now - deadline >= interval:
+                    missed = int((now - deadline) / interval)
+                    self.missed += missed
+                    self._event(time.monotonic_ns() - self._t0, MISSED, missed)
+                    deadline += missed * interval
+                self.sample()
+                deadline += interval
+        except KeyboardInterrupt:
+            pass
+        self.flush()
+        return time.monotonic() - start
+
+    def flush(self):
+        self.out.write(self._log)
+        self._log = bytearray()
+
+
+def read_log(path):
+    """
+    Returns (start time, interval, targets, events) of a log, events as a
+    list of (ns since the start, address, value).
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    magic, version, count, started, interval = _HEADER.unpack_from(raw, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s: not a watch log" % path)
+    pos = _HEADER.size
+    targets = []
+    for _ in range(count):
+        addr, length, name = _TARGET.unpack_from(raw, pos)
+        targets.append((name.rstrip(b"\0").decode(), addr, length))
+        pos += _TARGET.size
+    # a log cut short by a crash ends in a partial event
+    end = pos + (len(raw) - pos) // _EVENT.size * _EVENT.size
+    events = list(_EVENT.iter_unpack(raw[pos:end]))
+    return started, interval, targets, events